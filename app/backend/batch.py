@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+from .ingestion import normalize_namespace, warm_up
+from .llm import LLMBackend, get_backend
+from .ratelimit import RateLimiter
+from .rag import LLM_RATE_LIMIT, generate_test_cases, generate_selenium_script
+
+# Offline batch generation of test plans (test cases and their Selenium
+# scripts) for many features, e.g. a nightly regeneration:
+#   python -m app.backend.batch features.txt -o plans.jsonl [--workers 8] [--rate-limit 5]
+#
+# Features are read one per line (blank lines and lines starting with # are
+# ignored) and processed by a pool of workers sharing one LLM backend, so the
+# rate limit applies to the whole run. Each finished feature is appended to
+# the output as one JSON line and flushed to disk; the output doubles as the
+# checkpoint: a rerun skips the features already recorded with status "ok"
+# and retries the failed ones, bypassing the LLM response cache so that a bad
+# cached response is not served again. Work lost to an interruption is mostly
+# served from the cache when it is redone.
+
+# Features generated concurrently by the batch runner
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "4"))
+
+# Scripts whose generation failed start with this prefix (see generate_selenium_script)
+_SCRIPT_ERROR_PREFIX = "# Error generating script"
+
+def read_features(path: str) -> List[str]:
+    """Reads one feature per line, without blanks, comments and repeats."""
+    features = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            feature = line.strip()
+            if feature and not feature.startswith("#") and feature not in features:
+                features.append(feature)
+    return features
+
+def load_checkpoint(path: str) -> Dict[str, str]:
+    """
+    Returns the last status ("ok" or "failed") recorded for each feature in an
+    output file. A torn last line (the run was killed mid-write) is truncated away.
+    """
+    statuses = {}
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        return statuses
+    with f:
+        offset = 0
+        for line in f:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("missing newline")
+                record = json.loads(line)
+            except ValueError:
+                print(f"Truncating incomplete record at byte {offset} of {path}")
+                f.truncate(offset)
+                break
+            offset += len(line)
+            statuses[record["feature"]] = record.get("status")
+    return statuses
+
+class _Output:
+    """Appends records to the output file, one flushed JSON line at a time."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: dict):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+def generate_plan(feature: str, api_key: str, backend: LLMBackend, namespace: Optional[str] = None,
+                  html_content: str = "", scripts: bool = True) -> dict:
+    """Generates the test cases of a feature and, with `scripts`, a Selenium script per test case."""
+    start = time.perf_counter()
+    test_cases = generate_test_cases(feature, api_key, backend=backend, namespace=namespace)
+    record = {"feature": feature, "test_cases": [test_case.model_dump() for test_case in test_cases]}
+    errors = [] if test_cases else ["no test cases generated"]
+    if scripts:
+        record["scripts"] = []
+        for test_case in test_cases:
+            script = generate_selenium_script(test_case, html_content, api_key, backend=backend, namespace=namespace)
+            if script.startswith(_SCRIPT_ERROR_PREFIX):
+                errors.append(f"{test_case.test_id}: {script[2:]}")
+            record["scripts"].append({"test_id": test_case.test_id, "script_code": script})
+    record["status"] = "failed" if errors else "ok"
+    if errors:
+        record["errors"] = errors
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+def run_batch(
+    features: List[str],
+    output_path: str,
+    api_key: str,
+    namespace: Optional[str] = None,
+    workers: Optional[int] = None,
+    rate_limit: Optional[float] = None,
+    html_content: str = "",
+    scripts: bool = True,
+    resume: bool = True,
+) -> Dict[str, int]:
+    """
+    Generates the test plans of `features` with `workers` threads (defaults to
+    BATCH_WORKERS), throttling upstream LLM calls to `rate_limit` per second
+    (defaults to LLM_RATE_LIMIT, 0 = unlimited), and appends one record per
+    feature to `output_path` as it finishes. With `resume`, features already
+    in the output with status "ok" are skipped and failed ones are retried
+    without the LLM response cache; otherwise the output is replaced.
+    Returns the counts of ok, failed and skipped features.
+    """
+    workers = workers or BATCH_WORKERS
+    rate_limit = LLM_RATE_LIMIT if rate_limit is None else rate_limit
+    if not resume and os.path.exists(output_path):
+        os.remove(output_path)
+    statuses = load_checkpoint(output_path)
+    pending = [feature for feature in features if statuses.get(feature) != "ok"]
+    counts = {"ok": 0, "failed": 0, "skipped": len(features) - len(pending)}
+    if not pending:
+        return counts
+
+    # One backend for the whole run: the rate limiter and the response cache are shared by every worker
+    rate_limiter = RateLimiter(rate_limit) if rate_limit > 0 else None
+    backend = get_backend(api_key, rate_limiter=rate_limiter)
+    # Failures are often bad model responses, which the cache would serve again
+    retry_backend = get_backend(api_key, use_cache=False, rate_limiter=rate_limiter)
+    warm_up(namespace)
+    output = _Output(output_path)
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="qa-batch")
+
+    def process(feature: str) -> dict:
+        try:
+            feature_backend = retry_backend if statuses.get(feature) == "failed" else backend
+            record = generate_plan(feature, api_key, feature_backend, namespace, html_content, scripts)
+        except Exception as e:
+            record = {"feature": feature, "status": "failed", "errors": [str(e)]}
+        # Written by the worker, so features finishing during a shutdown are kept
+        output.write(record)
+        return record
+
+    try:
+        futures = {executor.submit(process, feature): feature for feature in pending}
+        for future in as_completed(futures):
+            record = future.result()
+            counts[record["status"]] += 1
+            finished = counts["ok"] + counts["failed"]
+            print(
+                f"[{finished}/{len(pending)}] {record['feature']}: {record['status']}, "
+                f"{len(record.get('test_cases', []))} test cases ({record.get('seconds', 0)}s)",
+                file=sys.stderr,
+            )
+    except KeyboardInterrupt:
+        print("Interrupted: finishing the features in progress; rerun to resume", file=sys.stderr)
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        output.close()
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate test plans for many features")
+    parser.add_argument("features", help="file with one feature per line")
+    parser.add_argument("-o", "--output", required=True, help="JSONL output, also the checkpoint of the run")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY", ""),
+                        help="Gemini API key (defaults to GEMINI_API_KEY)")
+    parser.add_argument("--namespace", default=None, help="knowledge base to generate from")
+    parser.add_argument("--workers", type=int, default=None, help=f"features in flight (default {BATCH_WORKERS})")
+    parser.add_argument("--rate-limit", type=float, default=None,
+                        help=f"upstream LLM requests per second, 0 = unlimited (default {LLM_RATE_LIMIT:g})")
+    parser.add_argument("--html", default=None, help="HTML of the target page (defaults to the ingested pages)")
+    parser.add_argument("--no-scripts", action="store_true", help="only generate test cases")
+    parser.add_argument("--restart", action="store_true", help="ignore and replace the existing output")
+    args = parser.parse_args(argv)
+
+    namespace = normalize_namespace(args.namespace)
+    html_content = ""
+    if args.html:
+        with open(args.html, "r", encoding="utf-8") as f:
+            html_content = f.read()
+    try:
+        counts = run_batch(
+            read_features(args.features),
+            args.output,
+            args.api_key,
+            namespace=namespace,
+            workers=args.workers,
+            rate_limit=args.rate_limit,
+            html_content=html_content,
+            scripts=not args.no_scripts,
+            resume=not args.restart,
+        )
+    except KeyboardInterrupt:
+        sys.exit(130)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(2)
+    print(json.dumps(counts), file=sys.stderr)
+    sys.exit(1 if counts["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with an optional time-to-live.
+    A ttl of None keeps entries until they are evicted by size.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class DiskLRUCache:
+    """
+    Persistent, size-bounded key/value store backed by SQLite. Once more than
+    `max_entries` values are stored, the least recently used ones are evicted.
+    """
+
+    # Stay well below SQLite's bound-parameter limit
+    _BATCH = 500
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            self._conn.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        unique = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(unique), self._BATCH):
+                batch = unique[start:start + self._BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+        return found
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: Dict[str, bytes]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, last_used) VALUES (?, ?, ?)",
+                [(key, value, now) for key, value in items.items()],
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def set(self, key: str, value: bytes):
+        self.set_many({key: value})
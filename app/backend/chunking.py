@@ -0,0 +1,168 @@
+import os
+import re
+import json
+from typing import Iterable, Iterator, Tuple
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+# Structure-aware chunking: documents are split on their own structure
+# (Markdown headings, JSON paths, HTML heading sections, PDF pages) and small
+# neighbouring sections are packed together up to a token limit. Every chunk
+# carries the path of the section it starts in.
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "256"))
+
+_MD_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_HTML_HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+def _split_oversized(text: str, max_tokens: int) -> Iterator[str]:
+    """Splits text over the limit on paragraph, then line, then word boundaries."""
+    if estimate_tokens(text) <= max_tokens:
+        yield text
+        return
+    for separator in ("\n\n", "\n", " "):
+        parts = [part for part in text.split(separator) if part.strip()]
+        if len(parts) > 1:
+            buffer = []
+            for part in parts:
+                if estimate_tokens(part) > max_tokens:
+                    if buffer:
+                        yield separator.join(buffer)
+                        buffer = []
+                    yield from _split_oversized(part, max_tokens)
+                elif buffer and estimate_tokens(separator.join(buffer + [part])) > max_tokens:
+                    yield separator.join(buffer)
+                    buffer = [part]
+                else:
+                    buffer.append(part)
+            if buffer:
+                yield separator.join(buffer)
+            return
+    # A single run without separators: hard split
+    size = max_tokens * 4
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+def _pack_sections(sections: Iterable[Tuple[str, str]], max_tokens: int) -> Iterator[Tuple[str, str]]:
+    """Packs consecutive (section, text) pairs into chunks of at most max_tokens."""
+    buffer, buffer_section = "", ""
+    for section, text in sections:
+        text = text.strip()
+        if not text:
+            continue
+        if estimate_tokens(text) > max_tokens:
+            if buffer:
+                yield buffer, buffer_section
+                buffer = ""
+            for piece in _split_oversized(text, max_tokens):
+                yield piece, section
+            continue
+        candidate = f"{buffer}\n\n{text}" if buffer else text
+        if buffer and estimate_tokens(candidate) > max_tokens:
+            yield buffer, buffer_section
+            buffer, buffer_section = text, section
+        else:
+            if not buffer:
+                buffer_section = section
+            buffer = candidate
+    if buffer:
+        yield buffer, buffer_section
+
+def _markdown_sections(text: str) -> Iterator[Tuple[str, str]]:
+    """Splits Markdown into (heading path, text) sections."""
+    stack = []
+    path = ""
+    lines = []
+    in_code = False
+    for line in text.splitlines():
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        match = None if in_code else _MD_HEADING_RE.match(line)
+        if match:
+            if lines:
+                yield path, "\n".join(lines)
+            level = len(match.group(1))
+            stack = [(l, t) for l, t in stack if l < level] + [(level, match.group(2))]
+            path = " > ".join(t for _, t in stack)
+            lines = [line]
+        else:
+            lines.append(line)
+    if lines:
+        yield path, "\n".join(lines)
+
+def _json_sections(data, max_tokens: int, path: str = "") -> Iterator[Tuple[str, str]]:
+    """
+    Splits JSON into (path, compact JSON) sections, descending only into
+    values that do not fit the limit.
+    """
+    text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    labelled = f"{path}: {text}" if path else text
+    if estimate_tokens(labelled) <= max_tokens or not isinstance(data, (dict, list)) or not data:
+        yield path or "$", labelled
+        return
+    items = data.items() if isinstance(data, dict) else enumerate(data)
+    for key, value in items:
+        if isinstance(data, list):
+            child = f"{path}[{key}]"
+        else:
+            child = f"{path}.{key}" if path else str(key)
+        yield from _json_sections(value, max_tokens, child)
+
+def _html_sections(html: str) -> Iterator[Tuple[str, str]]:
+    """Splits an HTML page into heading sections of its visible text."""
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+
+    # Document-order walk that does not descend into headings, whose text is
+    # taken as a whole (an explicit stack, as pages can nest deeper than the
+    # recursion limit)
+    lines = []
+    stack = [soup]
+    while stack:
+        element = stack.pop()
+        if isinstance(element, Tag):
+            if element.name in _HTML_HEADINGS:
+                heading = " ".join(element.get_text(" ", strip=True).split())
+                if heading:
+                    lines.append("#" * _HTML_HEADINGS[element.name] + " " + heading)
+            else:
+                stack.extend(reversed(element.contents))
+        elif type(element) is NavigableString:
+            text = element.strip()
+            if text:
+                lines.append(text)
+    return _markdown_sections("\n".join(lines))
+
+def _pdf_sections(file_content: bytes) -> Iterator[Tuple[str, str]]:
+    """Opens the PDF from the in-memory bytes and yields its text one page at a time."""
+    import fitz  # PyMuPDF
+    doc = fitz.open(stream=file_content, filetype="pdf")
+    try:
+        for number, page in enumerate(doc, start=1):
+            yield f"page {number}", page.get_text()
+    finally:
+        doc.close()
+
+def iter_structured_chunks(file_content: bytes, filename: str,
+                           max_tokens: int = CHUNK_MAX_TOKENS) -> Iterator[Tuple[str, str]]:
+    """Yields (chunk_text, section) pairs split along the document's structure."""
+    ext = os.path.splitext(filename)[1].lower()
+    try:
+        if ext == ".pdf":
+            sections = _pdf_sections(file_content)
+        else:
+            text = file_content.decode("utf-8", errors="ignore")
+            if ext == ".md":
+                sections = _markdown_sections(text)
+            elif ext == ".json":
+                sections = _json_sections(json.loads(text), max_tokens)
+            elif ext == ".html":
+                sections = _html_sections(text)
+            else:  # .txt, etc.
+                sections = [("", text)]
+        yield from _pack_sections(sections, max_tokens)
+    except Exception as e:
+        print(f"Error chunking {filename}: {e}")
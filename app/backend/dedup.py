@@ -0,0 +1,117 @@
+import re
+import zlib
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+# Near-duplicate detection with MinHash signatures and LSH banding. Chunks are
+# compared as sets of word shingles; two chunks whose estimated Jaccard
+# similarity reaches the threshold are near-duplicates. With 16 bands of 8
+# rows, a pair with 0.8 similarity shares a band (becomes a candidate) with
+# 95% probability, and one with 0.85 with over 99%; candidates are then
+# checked against the threshold.
+
+NUM_PERMUTATIONS = 128
+BANDS = 16
+SHINGLE_WORDS = 3
+
+_WORD_RE = re.compile(r"\w+")
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(20240611)
+# a < 2^31 and shingle hashes < 2^32 keep a * x + b below 2^64
+_A = _rng.integers(1, 1 << 31, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+def _shingles(text: str) -> List[int]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    return sorted({zlib.crc32(gram.encode("utf-8")) for gram in grams})
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature (NUM_PERMUTATIONS values) of a text's word shingles."""
+    hashes = np.array(_shingles(text), dtype=np.uint64)
+    # (a * x + b) mod p for every permutation and shingle
+    values = (_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME
+    return values.min(axis=1)
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float((first == second).mean())
+
+class MinHashIndex:
+    """
+    In-memory LSH index of chunk signatures: finds previously indexed chunks
+    that are near-duplicates of a new one.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self._rows = NUM_PERMUTATIONS // BANDS
+        self._buckets: List[Dict[bytes, set]] = [{} for _ in range(BANDS)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._sources: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._signatures
+
+    def _bands(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(BANDS):
+            yield band, signature[band * self._rows:(band + 1) * self._rows].tobytes()
+
+    def add(self, doc_id: str, source: str, text: str = "", signature: Optional[np.ndarray] = None):
+        """Indexes a chunk (no-op if already indexed)."""
+        with self._lock:
+            if doc_id in self._signatures:
+                return
+            signature = minhash(text) if signature is None else signature
+            self._signatures[doc_id] = signature
+            self._sources[doc_id] = source
+            for band, key in self._bands(signature):
+                self._buckets[band].setdefault(key, set()).add(doc_id)
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                signature = self._signatures.pop(doc_id, None)
+                if signature is None:
+                    continue
+                self._sources.pop(doc_id, None)
+                for band, key in self._bands(signature):
+                    bucket = self._buckets[band].get(key)
+                    if bucket is not None:
+                        bucket.discard(doc_id)
+                        if not bucket:
+                            del self._buckets[band][key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets = [{} for _ in range(BANDS)]
+            self._signatures.clear()
+            self._sources.clear()
+
+    def find(self, signature: np.ndarray,
+             accept: Optional[Callable[[str, str], bool]] = None) -> Optional[str]:
+        """
+        Returns the id of the most similar indexed chunk whose similarity
+        reaches the threshold, or None. `accept(doc_id, source)` can rule
+        candidates out.
+        """
+        with self._lock:
+            candidates = set()
+            for band, key in self._bands(signature):
+                candidates.update(self._buckets[band].get(key, ()))
+            best, best_similarity = None, self.threshold
+            for doc_id in candidates:
+                if accept is not None and not accept(doc_id, self._sources[doc_id]):
+                    continue
+                score = similarity(signature, self._signatures[doc_id])
+                if score >= best_similarity:
+                    best, best_similarity = doc_id, score
+            return best
@@ -0,0 +1,165 @@
+import os
+import json
+import hashlib
+from typing import List, Optional
+from bs4 import BeautifulSoup
+from .cache import LRUCache
+from .metrics import register_cache
+
+# Compact selector index of an HTML page: the ids, names, form fields, buttons,
+# labels and data attributes a Selenium script needs, without markup, CSS or JS.
+# Ingestion persists one index per uploaded HTML page in an index directory.
+
+INTERACTIVE_TAGS = {"input", "select", "textarea", "button", "form"}
+MAX_TEXT_LENGTH = 60
+MAX_OPTIONS = 10
+
+# Indexes built on the fly from raw HTML (e.g. passed in a request), by content hash
+_index_cache = LRUCache(max_size=32)
+register_cache("selector_index", _index_cache)
+
+def _text(element) -> str:
+    text = " ".join(element.get_text(" ", strip=True).split())
+    return text[:MAX_TEXT_LENGTH] + ("..." if len(text) > MAX_TEXT_LENGTH else "")
+
+def _is_hidden(element) -> bool:
+    style = (element.get("style") or "").replace(" ", "").lower()
+    return "display:none" in style or element.has_attr("hidden") or element.get("type") == "hidden"
+
+def _entry(element, labels: dict) -> dict:
+    entry = {"tag": element.name}
+    for attr in ("id", "name", "type", "value", "placeholder", "for", "href", "action", "role", "aria-label"):
+        if element.get(attr):
+            entry[attr] = element.get(attr)
+    classes = element.get("class") or []
+    if classes:
+        entry["class"] = classes[:3]
+    data = {k: v for k, v in element.attrs.items() if k.startswith("data-")}
+    if data:
+        entry["data"] = data
+    if element.name in ("button", "label", "a") or (element.get("id") and not element.find(True)):
+        text = _text(element)
+        if text:
+            entry["text"] = text
+    label = labels.get(element.get("id")) if element.get("id") else None
+    if label is None and element.name == "input" and element.parent is not None and element.parent.name == "label":
+        label = _text(element.parent)
+    if label:
+        entry["label"] = label
+    if element.has_attr("required"):
+        entry["required"] = True
+    if _is_hidden(element):
+        entry["hidden"] = True
+    if element.name == "select":
+        entry["options"] = [o.get("value") or _text(o) for o in element.find_all("option")[:MAX_OPTIONS]]
+    return entry
+
+def build_selector_index(html: str) -> dict:
+    """Extracts a compact selector index from an HTML page."""
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+
+    labels = {label.get("for"): _text(label) for label in soup.find_all("label") if label.get("for")}
+    elements = []
+    for element in soup.find_all(True):
+        if element.name == "option":
+            continue  # folded into their <select>
+        if (
+            element.name in INTERACTIVE_TAGS
+            or element.get("id")
+            or any(attr.startswith("data-") for attr in element.attrs)
+            or (element.name == "a" and element.get("href"))
+        ):
+            elements.append(_entry(element, labels))
+
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    headings = [_text(h) for h in soup.find_all(["h1", "h2", "h3"])]
+    return {"title": title, "headings": headings, "elements": elements}
+
+def format_selector_index(index: dict) -> str:
+    """Renders a selector index as one compact line per element for the LLM prompt."""
+    lines = []
+    if index.get("title"):
+        lines.append(f"Title: {index['title']}")
+    if index.get("headings"):
+        lines.append("Headings: " + " | ".join(index["headings"]))
+    for entry in index.get("elements", []):
+        selector = entry["tag"]
+        if entry.get("id"):
+            selector += f"#{entry['id']}"
+        if entry.get("class"):
+            selector += "".join(f".{c}" for c in entry["class"])
+        parts = [selector]
+        for attr in ("name", "type", "value", "placeholder", "for", "href", "action", "role", "aria-label", "label"):
+            if entry.get(attr):
+                parts.append(f'{attr}="{entry[attr]}"')
+        for key, value in entry.get("data", {}).items():
+            parts.append(f'{key}="{value}"')
+        if entry.get("options"):
+            parts.append("options=" + ",".join(str(o) for o in entry["options"]))
+        if entry.get("required"):
+            parts.append("required")
+        if entry.get("hidden"):
+            parts.append("hidden")
+        if entry.get("text"):
+            parts.append(f'text="{entry["text"]}"')
+        lines.append(" ".join(parts))
+    return "\n".join(lines)
+
+def save_selector_index(index_dir: str, source: str, html: str):
+    """Builds and persists the selector index of an uploaded HTML page."""
+    write_selector_index(index_dir, source, build_selector_index(html))
+
+def write_selector_index(index_dir: str, source: str, index: dict):
+    """Persists an already built selector index (e.g. from a snapshot)."""
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, f"{source}.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f)
+
+def delete_selector_index(index_dir: str, source: Optional[str] = None):
+    """Deletes the persisted index of `source`, or of every page when source is None."""
+    if not os.path.isdir(index_dir):
+        return
+    names = [f"{source}.json"] if source else os.listdir(index_dir)
+    for name in names:
+        try:
+            os.remove(os.path.join(index_dir, name))
+        except FileNotFoundError:
+            pass
+
+def has_selector_index(index_dir: str, source: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, f"{source}.json"))
+
+def list_indexed_pages(index_dir: str) -> List[str]:
+    if not os.path.isdir(index_dir):
+        return []
+    return sorted(name[:-len(".json")] for name in os.listdir(index_dir) if name.endswith(".json"))
+
+def load_selector_index(index_dir: str, source: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(index_dir, f"{source}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def page_selectors(index_dir: str, html_content: Optional[str] = None) -> str:
+    """
+    Returns the formatted selector index for the script-generation prompt:
+    built from `html_content` when given (cached by content hash), otherwise
+    from the pages persisted at ingestion time.
+    """
+    if html_content:
+        key = hashlib.sha256(html_content.encode("utf-8")).hexdigest()
+        formatted = _index_cache.get(key)
+        if formatted is None:
+            formatted = format_selector_index(build_selector_index(html_content))
+            _index_cache.set(key, formatted)
+        return formatted
+
+    sections = []
+    for source in list_indexed_pages(index_dir):
+        index = load_selector_index(index_dir, source)
+        if index is not None:
+            sections.append(f"Page: {source}\n{format_selector_index(index)}")
+    return "\n\n".join(sections)
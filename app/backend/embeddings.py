@@ -0,0 +1,242 @@
+import os
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from .cache import DiskLRUCache
+from .metrics import register_cache
+
+# On-disk embedding cache, keyed by (model name, chunk-text hash)
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "data/embedding_cache.db")
+# Maximum number of cached vectors before least-recently-used entries are evicted (0 disables the cache)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+
+# Encoder backend: "sentence-transformers" (full-precision PyTorch) or
+# "onnx-int8" (int8-quantized ONNX export of all-MiniLM-L6-v2 on onnxruntime,
+# several times faster on CPU-only nodes)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "sentence-transformers")
+# ONNX backend: texts per forward pass and intra-op threads (0 = one per core)
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", "0"))
+# Directory holding model.onnx and tokenizer.json; by default Chroma's export
+# is downloaded on first use. The quantized model is written next to it.
+EMBEDDING_ONNX_DIR = os.environ.get("EMBEDDING_ONNX_DIR")
+
+class CachedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Wraps an embedding function with a persistent, size-bounded LRU cache.
+    Only texts that are not in the cache are sent to the wrapped model.
+    """
+
+    def __init__(self, embedding_function: EmbeddingFunction, model_name: str,
+                 cache_path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.embedding_function = embedding_function
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._cache = DiskLRUCache(cache_path, max_entries)
+        register_cache("embedding", self)
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        keys = [self._key(text) for text in input]
+        cached = {key: np.frombuffer(blob, dtype=np.float32) for key, blob in self._cache.get_many(keys).items()}
+
+        missing = {}
+        for key, text in zip(keys, input):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        self.hits += len(keys) - sum(1 for key in keys if key in missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.embedding_function(list(missing.values()))
+            computed = dict(zip(missing.keys(), (np.asarray(v, dtype=np.float32) for v in vectors)))
+            self._cache.set_many({key: vector.tobytes() for key, vector in computed.items()})
+            cached.update(computed)
+
+        return [cached[key] for key in keys]
+
+    def name(self) -> str:
+        # Report the wrapped model so existing collections do not see a conflict
+        return self.embedding_function.name()
+
+    def is_legacy(self) -> bool:
+        # The cache is a local wrapper and cannot be rebuilt from a persisted config
+        return True
+
+    def get_config(self) -> Dict[str, Any]:
+        return self.embedding_function.get_config()
+
+def cached_embedding_function(embedding_function: EmbeddingFunction, model_name: str) -> EmbeddingFunction:
+    """Wraps `embedding_function` with the on-disk cache unless it is disabled."""
+    if EMBEDDING_CACHE_MAX_ENTRIES <= 0:
+        return embedding_function
+    return CachedEmbeddingFunction(embedding_function, model_name)
+
+def _onnx_model_dir() -> str:
+    if EMBEDDING_ONNX_DIR:
+        return EMBEDDING_ONNX_DIR
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+    model = ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+    # Reuses Chroma's verified download of the exported model
+    model._download_model_if_not_exists()
+    return os.path.join(model.DOWNLOAD_PATH, model.EXTRACTED_FOLDER_NAME)
+
+def _quantized_model_path(model_dir: str) -> str:
+    """Dynamically quantizes model.onnx to int8 weights once and returns the quantized model's path."""
+    path = os.path.join(model_dir, "model_int8.onnx")
+    if not os.path.exists(path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        quantize_dynamic(os.path.join(model_dir, "model.onnx"), tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, path)
+    return path
+
+class QuantizedONNXEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    all-MiniLM-L6-v2 on onnxruntime with int8 weights. Texts are sorted by
+    length into batches that are padded to their longest text rather than
+    to the model's 256-token limit, and longer texts are truncated the same
+    way sentence-transformers does.
+    """
+
+    MODEL_NAME = "all-MiniLM-L6-v2"
+    MAX_TOKENS = 256
+
+    def __init__(self, batch_size: int = EMBEDDING_BATCH_SIZE, threads: int = EMBEDDING_THREADS,
+                 model_dir: Optional[str] = None):
+        self.batch_size = max(1, batch_size)
+        self.threads = threads
+        self.model_dir = model_dir
+        self._session = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._session is None:
+                import onnxruntime
+                from tokenizers import Tokenizer
+                model_dir = self.model_dir or _onnx_model_dir()
+                tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+                tokenizer.enable_truncation(max_length=self.MAX_TOKENS)
+                tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+                options = onnxruntime.SessionOptions()
+                options.log_severity_level = 3
+                options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+                if self.threads > 0:
+                    options.intra_op_num_threads = self.threads
+                self._session = onnxruntime.InferenceSession(
+                    _quantized_model_path(model_dir), sess_options=options, providers=["CPUExecutionProvider"]
+                )
+                self._tokenizer = tokenizer
+        return self._session, self._tokenizer
+
+    def __call__(self, input: Documents) -> Embeddings:
+        session, tokenizer = self._load()
+        input_names = {i.name for i in session.get_inputs()}
+        vectors: List[Optional[np.ndarray]] = [None] * len(input)
+        order = sorted(range(len(input)), key=lambda i: len(input[i]))
+
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = tokenizer.encode_batch([input[i] for i in batch])
+            input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask,
+                     "token_type_ids": np.zeros_like(input_ids)}
+            hidden = session.run(None, {k: v for k, v in feeds.items() if k in input_names})[0]
+
+            # Mean pooling over real tokens, then L2 normalisation, as in sentence-transformers
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            for i, vector in zip(batch, pooled.astype(np.float32)):
+                vectors[i] = vector
+
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "onnx_int8_mini_lm_l6_v2"
+
+    def is_legacy(self) -> bool:
+        # Local encoder, not registered with Chroma
+        return True
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"batch_size": self.batch_size, "threads": self.threads}
+
+def create_embedding_function(model_name: str) -> EmbeddingFunction:
+    """Builds the EMBEDDING_BACKEND encoder for `model_name`, behind the on-disk cache."""
+    if EMBEDDING_BACKEND == "onnx-int8":
+        if model_name != QuantizedONNXEmbeddingFunction.MODEL_NAME:
+            raise ValueError(f"The onnx-int8 backend only supports {QuantizedONNXEmbeddingFunction.MODEL_NAME}")
+        # Quantized vectors differ slightly from the PyTorch ones, so they are cached separately
+        return cached_embedding_function(QuantizedONNXEmbeddingFunction(), f"{model_name}/onnx-int8")
+    if EMBEDDING_BACKEND != "sentence-transformers":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {EMBEDDING_BACKEND}")
+    from chromadb.utils import embedding_functions
+    return cached_embedding_function(
+        embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name), model_name
+    )
+
+def check_parity(candidate: EmbeddingFunction, reference: EmbeddingFunction, texts: List[str],
+                 min_similarity: float = 0.98) -> Dict[str, Any]:
+    """
+    Compares two encoders on `texts`: the cosine similarity of each text's two
+    vectors, and how often both agree on each text's nearest neighbour.
+    Passes when the lowest similarity is at least `min_similarity`.
+    """
+    def unit(vectors):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+    a = unit(candidate(texts))
+    b = unit(reference(texts))
+    similarity = (a * b).sum(axis=1)
+
+    neighbour_agreement = 1.0
+    if len(texts) > 1:
+        neighbours = []
+        for matrix in (a, b):
+            scores = matrix @ matrix.T
+            np.fill_diagonal(scores, -np.inf)
+            neighbours.append(scores.argmax(axis=1))
+        neighbour_agreement = float((neighbours[0] == neighbours[1]).mean())
+
+    return {
+        "texts": len(texts),
+        "mean_similarity": float(similarity.mean()),
+        "min_similarity": float(similarity.min()),
+        "neighbour_agreement": neighbour_agreement,
+        "passed": bool(similarity.min() >= min_similarity),
+    }
+
+if __name__ == "__main__":
+    # Parity check of the quantized ONNX encoder against the sentence-transformers
+    # model on the chunks of the sample documents:
+    #   python -m app.backend.embeddings [data_dir]
+    import sys
+    import json
+    from chromadb.utils import embedding_functions
+    from .ingestion import EMBEDDING_MODEL, iter_document_chunks
+
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "data"
+    texts = []
+    for filename in sorted(os.listdir(data_dir)):
+        with open(os.path.join(data_dir, filename), "rb") as f:
+            texts.extend(chunk for chunk, _ in iter_document_chunks(f.read(), filename))
+
+    report = check_parity(
+        QuantizedONNXEmbeddingFunction(),
+        embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL),
+        texts,
+    )
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["passed"] else 1)
@@ -1,24 +1,265 @@
 import os
-from typing import List
-import chromadb
-from chromadb.utils import embedding_functions
-import fitz  # PyMuPDF
+import re
+import time
+from typing import Callable, Iterable, Iterator, List, Optional
 import json
 from bs4 import BeautifulSoup
-import uuid
+import hashlib
+import itertools
+import threading
+from collections import Counter, OrderedDict, deque
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from .dom_index import (
+    save_selector_index, write_selector_index, delete_selector_index, has_selector_index, list_indexed_pages,
+    load_selector_index,
+)
+from .lexical import BM25Index
+from .dedup import MinHashIndex, minhash
+from .chunking import CHUNK_MAX_TOKENS, iter_structured_chunks
+from .metrics import timed, record_error, INGEST_CHUNKS
 
-# Initialize ChromaDB
-# We use a persistent client so data is saved to disk
-CHROMA_DATA_PATH = "data/chroma_db"
-os.makedirs(CHROMA_DATA_PATH, exist_ok=True)
+# ChromaDB settings
+# We use a persistent client so data is saved to disk. The client, the embedding
+# model and the collection are heavy, so they are created lazily on first use
+# (see get_knowledge_base) instead of at import time.
+CHROMA_DATA_PATH = os.environ.get("CHROMA_DATA_PATH", "data/chroma_db")
+COLLECTION_NAME = "qa_agent_docs"
 
-client = chromadb.PersistentClient(path=CHROMA_DATA_PATH)
+# Per-source manifest: records the content hash and chunk ids of every ingested
+# source so that rebuilds only embed new or changed chunks (default namespace).
+MANIFEST_PATH = os.path.join(CHROMA_DATA_PATH, "manifest.json")
+
+# Compact selector index of every ingested HTML page, used for script generation (default namespace)
+SELECTOR_INDEX_DIR = os.path.join(CHROMA_DATA_PATH, "selector_index")
+
+# Number of worker processes used to parse and chunk documents (0 or 1 = in-process)
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "0"))
+
+# Chunking strategy: "structure" (Markdown headings, JSON paths, HTML sections,
+# token-limited; see chunking.py) or "fixed" (1000-character overlapping windows)
+CHUNKER = os.environ.get("CHUNKER", "structure")
+
+# Number of chunks sent to Chroma per collection.add call
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "256"))
+
+# Near-duplicate chunks (estimated Jaccard similarity of their word shingles
+# at or above DEDUP_THRESHOLD to a chunk already in the knowledge base) are not
+# embedded: the manifest links them to that chunk instead (0 = disabled; see dedup.py)
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.85"))
 
 # Use a standard lightweight model for embeddings
-sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Vector store: "chroma" (PersistentClient: SQLite + HNSW) or "numpy", an
+# in-process memory-mapped matrix with exact search that opens near-instantly
+# and suits small and medium knowledge bases (see vectorstore.py)
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "chroma")
+
+# Knowledge bases are namespaced per project / session. The default namespace
+# keeps the original collection and paths; every other namespace gets its own
+# collection and a directory (manifest, selector index) under NAMESPACES_DIR.
+DEFAULT_NAMESPACE = "default"
+NAMESPACES_DIR = os.path.join(CHROMA_DATA_PATH, "namespaces")
+# Collection names must start and end with a letter or digit
+_NAMESPACE_RE = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,61}[A-Za-z0-9])?$")
+
+# Loaded knowledge bases (collection handle and BM25 index) are kept in an LRU:
+# at most KB_MAX_LOADED stay in memory, and any idle for more than
+# KB_IDLE_SECONDS (0 = never) is evicted. Evicted ones reload on next use.
+KB_MAX_LOADED = int(os.environ.get("KB_MAX_LOADED", "8"))
+KB_IDLE_SECONDS = float(os.environ.get("KB_IDLE_SECONDS", "900"))
+
+_client = None
+_vector_store = None
+_embedding_function = None
+_init_lock = threading.RLock()
+
+# Knowledge-base generations: a namespace takes a new, globally unique value on
+# every change to its collection (and when it is loaded), so that caches keyed
+# on it (e.g. retrieval results) are invalidated automatically
+_generations = itertools.count(1)
+_generation_lock = threading.Lock()
+
+def _next_generation() -> int:
+    with _generation_lock:
+        return next(_generations)
+
+class _KnowledgeBase:
+    """In-memory state of one namespace: collection handle, BM25 index, generation and paths."""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        if namespace == DEFAULT_NAMESPACE:
+            self.collection_name = COLLECTION_NAME
+            self.manifest_path = MANIFEST_PATH
+            self.selector_index_dir = SELECTOR_INDEX_DIR
+        else:
+            directory = os.path.join(NAMESPACES_DIR, namespace)
+            self.collection_name = f"{COLLECTION_NAME}__{namespace}"
+            self.manifest_path = os.path.join(directory, "manifest.json")
+            self.selector_index_dir = os.path.join(directory, "selector_index")
+        self.collection = None
+        # In-memory BM25 index over the collection for lexical / hybrid retrieval.
+        # Built from the collection on first use, then kept in sync by every write.
+        self.lexical_index = None
+        # MinHash index of the collection for near-duplicate detection, built on
+        # the first ingestion that adds chunks
+        self.dedup_index = None
+        self.generation = _next_generation()
+        self.last_used = time.monotonic()
+        self.lock = threading.RLock()
+        # Held by ingestion and clearing: one writer per namespace at a time
+        self.write_lock = threading.Lock()
+
+_knowledge_bases: "OrderedDict[str, _KnowledgeBase]" = OrderedDict()
+_knowledge_bases_lock = threading.Lock()
+
+def normalize_namespace(namespace: Optional[str]) -> str:
+    """Returns the namespace to use (DEFAULT_NAMESPACE when empty); raises ValueError if invalid."""
+    namespace = namespace or DEFAULT_NAMESPACE
+    if not _NAMESPACE_RE.match(namespace):
+        raise ValueError(
+            f"Invalid namespace {namespace!r}: use up to 63 letters, digits, '-' or '_', "
+            f"starting and ending with a letter or digit"
+        )
+    return namespace
 
-# Get or create the collection
-collection = client.get_or_create_collection(name="qa_agent_docs", embedding_function=sentence_transformer_ef)
+def _evict_idle():
+    """Evicts idle knowledge bases and those over KB_MAX_LOADED, least recently used first."""
+    now = time.monotonic()
+    # The most recently used one is never evicted, nor one that is being written
+    for namespace, kb in list(_knowledge_bases.items())[:-1]:
+        over_budget = len(_knowledge_bases) > KB_MAX_LOADED
+        idle = KB_IDLE_SECONDS > 0 and now - kb.last_used > KB_IDLE_SECONDS
+        if (over_budget or idle) and not kb.write_lock.locked():
+            del _knowledge_bases[namespace]
+
+def _get_kb(namespace: Optional[str] = None) -> _KnowledgeBase:
+    namespace = normalize_namespace(namespace)
+    with _knowledge_bases_lock:
+        kb = _knowledge_bases.get(namespace)
+        if kb is None:
+            kb = _knowledge_bases[namespace] = _KnowledgeBase(namespace)
+        kb.last_used = time.monotonic()
+        _knowledge_bases.move_to_end(namespace)
+        _evict_idle()
+    return kb
+
+def get_kb_generation(namespace: Optional[str] = None) -> int:
+    """Returns the current generation of a namespace's knowledge base."""
+    return _get_kb(namespace).generation
+
+def _bump_generation(kb: _KnowledgeBase):
+    kb.generation = _next_generation()
+
+def selector_index_dir(namespace: Optional[str] = None) -> str:
+    """Directory holding the selector indexes of a namespace's HTML pages."""
+    return _get_kb(namespace).selector_index_dir
+
+def _kb_collection(kb: _KnowledgeBase):
+    if kb.collection is None:
+        with kb.lock:
+            if kb.collection is None:
+                kb.collection = get_vector_store().get_or_create_collection(
+                    name=kb.collection_name, embedding_function=get_embedding_function()
+                )
+    return kb.collection
+
+def _kb_lexical_index(kb: _KnowledgeBase) -> BM25Index:
+    if kb.lexical_index is None:
+        with kb.lock:
+            if kb.lexical_index is None:
+                index = BM25Index()
+                collection = _kb_collection(kb)
+                offset = 0
+                while True:
+                    page = collection.get(include=["documents", "metadatas"], limit=1000, offset=offset)
+                    if not page["ids"]:
+                        break
+                    index.add(page["ids"], page["documents"], page["metadatas"])
+                    offset += len(page["ids"])
+                kb.lexical_index = index
+    return kb.lexical_index
+
+def _kb_dedup_index(kb: _KnowledgeBase) -> MinHashIndex:
+    if kb.dedup_index is None:
+        with kb.lock:
+            if kb.dedup_index is None:
+                index = MinHashIndex(DEDUP_THRESHOLD)
+                collection = _kb_collection(kb)
+                offset = 0
+                while True:
+                    page = collection.get(include=["documents", "metadatas"], limit=1000, offset=offset)
+                    if not page["ids"]:
+                        break
+                    for doc_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                        index.add(doc_id, (metadata or {}).get("source", ""), document)
+                    offset += len(page["ids"])
+                kb.dedup_index = index
+    return kb.dedup_index
+
+def get_lexical_index(namespace: Optional[str] = None) -> BM25Index:
+    """Returns the BM25 index of a namespace's knowledge base, building it on first use."""
+    return _kb_lexical_index(_get_kb(namespace))
+
+def _on_change(kb: _KnowledgeBase, added: Optional[tuple] = None, updated: Optional[tuple] = None,
+               removed: Optional[list] = None):
+    """
+    Propagates a write to a collection: keeps the lexical index in sync and
+    bumps the knowledge-base generation.
+    added: (ids, documents, metadatas), updated: (ids, metadatas), removed: ids
+    """
+    with kb.lock:
+        if kb.lexical_index is not None:
+            if added:
+                kb.lexical_index.add(*added)
+            if updated:
+                kb.lexical_index.update_metadata(*updated)
+            if removed:
+                kb.lexical_index.remove(removed)
+        if kb.dedup_index is not None and removed:
+            kb.dedup_index.remove(removed)
+    _bump_generation(kb)
+
+def get_client():
+    """Returns the persistent ChromaDB client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                import chromadb
+                os.makedirs(CHROMA_DATA_PATH, exist_ok=True)
+                _client = chromadb.PersistentClient(path=CHROMA_DATA_PATH)
+    return _client
+
+def get_vector_store():
+    """Returns the VECTOR_STORE backend (the Chroma client or a NumpyVectorStore)."""
+    global _vector_store
+    if _vector_store is None:
+        if VECTOR_STORE == "chroma":
+            return get_client()
+        if VECTOR_STORE != "numpy":
+            raise ValueError(f"Unknown VECTOR_STORE: {VECTOR_STORE}")
+        with _init_lock:
+            if _vector_store is None:
+                from .vectorstore import NumpyVectorStore
+                _vector_store = NumpyVectorStore(os.path.join(CHROMA_DATA_PATH, "numpy"))
+    return _vector_store
+
+def get_embedding_function():
+    """
+    Returns the embedding function, loading the model on first use.
+    It sits behind a persistent cache so byte-identical chunks are never
+    re-encoded across rebuilds.
+    """
+    global _embedding_function
+    if _embedding_function is None:
+        with _init_lock:
+            if _embedding_function is None:
+                from .embeddings import create_embedding_function
+                _embedding_function = create_embedding_function(EMBEDDING_MODEL)
+    return _embedding_function
 
 def parse_file(file_path: str) -> str:
     """Extracts text content from various file types."""
@@ -27,9 +268,10 @@ def parse_file(file_path: str) -> str:
     
     try:
         if ext == ".pdf":
+            import fitz  # PyMuPDF
             doc = fitz.open(file_path)
-            for page in doc:
-                content += page.get_text()
+            content = "".join(page.get_text() for page in doc)
+            doc.close()
         elif ext == ".html":
             with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
                 soup = BeautifulSoup(f, "html.parser")
@@ -54,10 +296,10 @@ def parse_file_content(file_content: bytes, filename: str) -> str:
     
     try:
         if ext == ".pdf":
-            # PyMuPDF can open from bytes
+            # PyMuPDF opens the PDF from the in-memory bytes, pages are read one at a time
+            import fitz  # PyMuPDF
             doc = fitz.open(stream=file_content, filetype="pdf")
-            for page in doc:
-                content += page.get_text()
+            content = "".join(page.get_text() for page in doc)
             doc.close()
         elif ext == ".html":
             soup = BeautifulSoup(file_content.decode("utf-8", errors="ignore"), "html.parser")
@@ -73,100 +315,570 @@ def parse_file_content(file_content: bytes, filename: str) -> str:
         
     return content
 
-def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-    """Simple overlapping chunker."""
+def iter_chunks(text: str, chunk_size: int = 1000, overlap: int = 200) -> Iterator[str]:
+    """Simple overlapping chunker, yielding chunks lazily."""
     if not text:
-        return []
+        return
     
-    chunks = []
     start = 0
     while start < len(text):
         end = start + chunk_size
-        chunks.append(text[start:end])
+        yield text[start:end]
         start += chunk_size - overlap
-    return chunks
 
-def ingest_documents(file_paths: List[str]) -> int:
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    """Simple overlapping chunker."""
+    return list(iter_chunks(text, chunk_size, overlap))
+
+def _chunker_id() -> str:
+    """Identifies the chunking configuration a manifest entry was built with."""
+    if CHUNKER == "structure":
+        return f"structure-{CHUNK_MAX_TOKENS}"
+    return "fixed-1000-200"
+
+def iter_document_chunks(file_content: bytes, filename: str) -> Iterator[tuple]:
+    """Yields (chunk_text, section) pairs for a document using the configured chunker."""
+    if CHUNKER == "structure":
+        return iter_structured_chunks(file_content, filename)
+    return ((chunk, "") for chunk in iter_chunks(parse_file_content(file_content, filename)))
+
+def _hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _iter_chunk_ids(source: str, chunks: Iterable[tuple]) -> Iterator[tuple]:
     """
-    Ingests a list of file paths into the ChromaDB collection.
-    Returns the number of chunks added.
+    Yields (chunk_id, chunk_text, section) with deterministic, content-addressed
+    ids. Identical chunks within the same source get an occurrence suffix.
     """
-    global collection
-    
-    chunks_to_add = []
-    metadatas = []
+    seen = {}
+    for chunk, section in chunks:
+        digest = hashlib.sha256(f"{source}\0{chunk}".encode("utf-8")).hexdigest()[:32]
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        yield (f"{source}_{digest}" if occurrence == 0 else f"{source}_{digest}_{occurrence}"), chunk, section
+
+def _load_manifest(kb: _KnowledgeBase) -> dict:
+    try:
+        with open(kb.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Error reading manifest, rebuilding from scratch: {e}")
+        return {}
+
+def _save_manifest(kb: _KnowledgeBase, manifest: dict):
+    os.makedirs(os.path.dirname(kb.manifest_path), exist_ok=True)
+    tmp_path = kb.manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, kb.manifest_path)
+
+def _parse_and_chunk(source: str, file_content: bytes) -> List[tuple]:
+    """Parses and chunks a single source. Runs in a worker process when a pool is used."""
+    return list(iter_document_chunks(file_content, source))
+
+def _collect_parsed(source: str, future) -> List[tuple]:
+    try:
+        with timed("ingest_parse_wait"):
+            return future.result()
+    except Exception as e:
+        record_error("ingest_parse", e)
+        print(f"Error parsing {source}: {e}")
+        return []
+
+def _iter_parsed(pending: Iterable[tuple], workers: int) -> Iterator[tuple]:
+    """
+    Parses and chunks (source, file_content, file_hash) triples, yielding
+    (source, file_hash, chunks) in input order, where chunks are
+    (chunk_text, section) pairs. With workers > 1 the work fans
+    out to a process pool with at most 2 * workers files in flight, so memory
+    stays bounded; a source that fails to parse yields no chunks without
+    affecting the others.
+    """
+    if workers <= 1:
+        for source, file_content, file_hash in pending:
+            yield source, file_hash, iter_document_chunks(file_content, source)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for source, file_content, file_hash in pending:
+            in_flight.append((source, file_hash, executor.submit(_parse_and_chunk, source, file_content)))
+            if len(in_flight) >= 2 * workers:
+                source, file_hash, future = in_flight.popleft()
+                yield source, file_hash, _collect_parsed(source, future)
+        while in_flight:
+            source, file_hash, future = in_flight.popleft()
+            yield source, file_hash, _collect_parsed(source, future)
+
+class _BatchWriter:
+    """Buffers new chunks and flushes them to a collection in fixed-size batches."""
+
+    def __init__(self, kb: _KnowledgeBase, batch_size: int, progress: Optional[Callable[[int, int], None]] = None):
+        self.kb = kb
+        self.batch_size = max(1, batch_size)
+        self.progress = progress
+        self.batches = 0
+        self.added = 0
+        # Sources with chunks sitting in the unflushed buffer
+        self.sources = set()
+        # Near-duplicates linked during this run, id -> (source, document,
+        # metadata), and chunk ids deleted during this run
+        self.linked = {}
+        self.removed = set()
+        self._reset()
+
+    def _reset(self):
+        self.documents, self.metadatas, self.ids = [], [], []
+
+    def add(self, chunk_id: str, document: str, metadata: dict):
+        self.ids.append(chunk_id)
+        self.documents.append(document)
+        self.metadatas.append(metadata)
+        self.sources.add(metadata["source"])
+        if len(self.ids) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.ids:
+            return
+        with timed("ingest_embed_add"):
+            _kb_collection(self.kb).add(documents=self.documents, metadatas=self.metadatas, ids=self.ids)
+        INGEST_CHUNKS.inc(len(self.ids), result="added")
+        _on_change(self.kb, added=(self.ids, self.documents, self.metadatas))
+        self.batches += 1
+        self.added += len(self.ids)
+        self._reset()
+        self.sources = set()
+        if self.progress:
+            self.progress(self.batches, self.added)
+
+def _route_new_chunk(source: str, chunk_id: str, chunk: str, metadata: dict, current: set,
+                     writer: _BatchWriter) -> Optional[str]:
+    """
+    Queues a new chunk for embedding, unless it is a near-duplicate of a
+    chunk in the knowledge base (or queued before it). Returns the id of that
+    chunk in the latter case. Older chunks of the same source that are not in
+    `current` are about to be replaced, so they never count.
+    """
+    if DEDUP_THRESHOLD <= 0:
+        writer.add(chunk_id, chunk, metadata)
+        return None
+    index = _kb_dedup_index(writer.kb)
+    signature = minhash(chunk)
+    canonical = index.find(
+        signature, accept=lambda doc_id, doc_source: doc_source != source or doc_id in current
+    )
+    if canonical is not None:
+        INGEST_CHUNKS.inc(result="duplicate")
+        writer.linked[chunk_id] = (source, chunk, metadata)
+        return canonical
+    # Indexed right away, so that duplicates within the same batch are caught
+    index.add(chunk_id, source, signature=signature)
+    writer.add(chunk_id, chunk, metadata)
+    return None
+
+def _sync_window(source: str, window: List[tuple], current: set, writer: _BatchWriter) -> dict:
+    """
+    Routes a window of (chunk_index, chunk_id, chunk, section) to the writer or a metadata update.
+    Returns the near-duplicates among the new chunks as {chunk_id: canonical_id}.
+    """
+    duplicates = {}
+    if not window:
+        return duplicates
+    with timed("ingest_lookup"):
+        found = _kb_collection(writer.kb).get(ids=[chunk_id for _, chunk_id, _, _ in window], include=["metadatas"])
+    existing = dict(zip(found["ids"], found["metadatas"]))
+
+    moved_ids, moved_metadatas = [], []
+    for i, chunk_id, chunk, section in window:
+        metadata = {"source": source, "chunk_index": i}
+        if section:
+            metadata["section"] = section
+        if chunk_id not in existing:
+            canonical = _route_new_chunk(source, chunk_id, chunk, metadata, current, writer)
+            if canonical is not None:
+                duplicates[chunk_id] = canonical
+        elif (existing[chunk_id] or {}) != metadata:
+            moved_ids.append(chunk_id)
+            moved_metadatas.append(metadata)
+
+    INGEST_CHUNKS.inc(len(existing) - len(moved_ids), result="unchanged")
+    if moved_ids:
+        INGEST_CHUNKS.inc(len(moved_ids), result="updated")
+        # Metadata-only update, no re-embedding
+        _kb_collection(writer.kb).update(ids=moved_ids, metadatas=moved_metadatas)
+        _on_change(writer.kb, updated=(moved_ids, moved_metadatas))
+    return duplicates
+
+def _delete_chunks(writer: _BatchWriter, ids: List[str]):
+    INGEST_CHUNKS.inc(len(ids), result="removed")
+    _kb_collection(writer.kb).delete(ids=ids)
+    _on_change(writer.kb, removed=ids)
+    writer.removed.update(ids)
+
+def _apply_chunks(source: str, file_hash: str, file_chunks: Iterable[tuple], manifest: dict, writer: _BatchWriter) -> int:
+    """
+    Brings the chunks of one source in the collection up to date.
+    Only new chunks are embedded and chunks that no longer exist are deleted.
+    Near-duplicates of existing chunks are recorded in the manifest entry
+    ("duplicates": {chunk_id: canonical_id}) instead of being embedded.
+    Returns the number of chunks indexed for the source.
+    """
+    entry = manifest.get(source)
     ids = []
-    
-    for path in file_paths:
-        content = parse_file(path)
-        if not content:
-            continue
-            
-        file_chunks = chunk_text(content)
-        
-        for i, chunk in enumerate(file_chunks):
-            chunks_to_add.append(chunk)
-            metadatas.append({
-                "source": os.path.basename(path),
-                "chunk_index": i
-            })
-            ids.append(f"{os.path.basename(path)}_{i}_{uuid.uuid4()}")
-            
-    if chunks_to_add:
-        collection.add(
-            documents=chunks_to_add,
-            metadatas=metadatas,
-            ids=ids
+    current = set()
+    duplicates = {}
+    window = []
+    for i, (chunk_id, chunk, section) in enumerate(_iter_chunk_ids(source, file_chunks)):
+        ids.append(chunk_id)
+        current.add(chunk_id)
+        window.append((i, chunk_id, chunk, section))
+        if len(window) >= writer.batch_size:
+            duplicates.update(_sync_window(source, window, current, writer))
+            window = []
+    duplicates.update(_sync_window(source, window, current, writer))
+
+    stored_ids = [chunk_id for chunk_id in ids if chunk_id not in duplicates]
+    stale_ids = set(entry["ids"]) - set(stored_ids) if entry else set()
+    if stale_ids:
+        _delete_chunks(writer, list(stale_ids))
+
+    if ids:
+        manifest[source] = {"hash": file_hash, "chunker": _chunker_id(), "ids": stored_ids}
+        if duplicates:
+            manifest[source]["duplicates"] = duplicates
+    else:
+        manifest.pop(source, None)
+    return len(ids)
+
+def _prune_sources(manifest: dict, keep: set, writer: _BatchWriter):
+    """Deletes the chunks of every source in the manifest that is not in `keep`."""
+    for source in [s for s in manifest if s not in keep]:
+        delete_selector_index(writer.kb.selector_index_dir, source)
+        # The selector indexes are part of the knowledge base (see rag._page_selectors)
+        _bump_generation(writer.kb)
+        stale_ids = manifest.pop(source)["ids"]
+        if stale_ids:
+            _delete_chunks(writer, stale_ids)
+
+def _relink_duplicates(manifest: dict, writer: _BatchWriter) -> List[str]:
+    """
+    Handles near-duplicates whose canonical chunk was deleted during this run.
+    Those linked during this run are routed again (linked to another chunk or
+    embedded). Older ones are not in memory: their sources are marked for a
+    re-sync and returned.
+    """
+    resync = []
+    if not writer.removed:
+        return resync
+    for source, entry in manifest.items():
+        orphans = [dup for dup, canonical in entry.get("duplicates", {}).items() if canonical in writer.removed]
+        for chunk_id in orphans:
+            del entry["duplicates"][chunk_id]
+            if chunk_id not in writer.linked:
+                entry["hash"] = None
+                continue
+            _, chunk, metadata = writer.linked.pop(chunk_id)
+            current = set(entry["ids"]) | set(entry["duplicates"])
+            canonical = _route_new_chunk(source, chunk_id, chunk, metadata, current, writer)
+            if canonical is None:
+                entry["ids"].append(chunk_id)
+            else:
+                entry["duplicates"][chunk_id] = canonical
+        if "duplicates" in entry and not entry["duplicates"]:
+            del entry["duplicates"]
+        if entry["hash"] is None:
+            resync.append(source)
+    return resync
+
+def _entry_size(entry: dict) -> int:
+    return len(entry["ids"]) + len(entry.get("duplicates", {}))
+
+def _index_page(kb: _KnowledgeBase, source: str, file_content: bytes):
+    try:
+        save_selector_index(kb.selector_index_dir, source, file_content.decode("utf-8", errors="ignore"))
+        _bump_generation(kb)
+    except Exception as e:
+        record_error("ingest_selector_index", e)
+        print(f"Error indexing selectors of {source}: {e}")
+
+def _ingest_sources(
+    kb: _KnowledgeBase,
+    sources: Iterable[tuple],
+    prune: bool,
+    workers: Optional[int],
+    batch_size: Optional[int],
+    progress: Optional[Callable[[int, int], None]],
+    stats: Optional[dict] = None,
+) -> int:
+    """
+    Shared streaming ingestion pipeline for (source, file_content) pairs:
+    parse -> chunk -> embed -> add, flushed to Chroma in batches.
+    Unchanged sources are skipped without parsing; changed ones are parsed
+    (optionally in parallel) and synced into the collection in input order.
+    Ingestions into the same namespace run one at a time.
+    """
+    with kb.write_lock:
+        return _ingest_locked(kb, sources, prune, workers, batch_size, progress, stats)
+
+def _ingest_locked(
+    kb: _KnowledgeBase,
+    sources: Iterable[tuple],
+    prune: bool,
+    workers: Optional[int],
+    batch_size: Optional[int],
+    progress: Optional[Callable[[int, int], None]],
+    stats: Optional[dict],
+) -> int:
+    workers = INGEST_WORKERS if workers is None else workers
+    writer = _BatchWriter(kb, INGEST_BATCH_SIZE if batch_size is None else batch_size, progress)
+    chunker = _chunker_id()
+    manifest = _load_manifest(kb)
+    total = 0
+    seen = set()
+    # Unchanged sources that link near-duplicates, kept in case the chunks
+    # they link to are deleted later in the run
+    linking = {}
+
+    def changed_sources():
+        nonlocal total
+        for source, file_content in sources:
+            if source in seen:
+                # Both would share one manifest entry and delete each other's chunks
+                raise ValueError(f"Duplicate source name: {source}")
+            seen.add(source)
+            file_hash = _hash_bytes(file_content)
+            entry = manifest.get(source)
+            unchanged = entry and entry["hash"] == file_hash and entry.get("chunker") == chunker
+            if source.lower().endswith(".html") and not (unchanged and has_selector_index(kb.selector_index_dir, source)):
+                _index_page(kb, source, file_content)
+            if unchanged:
+                INGEST_CHUNKS.inc(_entry_size(entry), result="skipped")
+                total += _entry_size(entry)
+                if entry.get("duplicates"):
+                    linking[source] = (file_content, file_hash)
+                continue
+            yield source, file_content, file_hash
+
+    try:
+        with timed("ingest"):
+            for source, file_hash, file_chunks in _iter_parsed(changed_sources(), workers):
+                with timed("ingest_source"):
+                    total += _apply_chunks(source, file_hash, file_chunks, manifest, writer)
+
+            if prune:
+                _prune_sources(manifest, seen, writer)
+            for source in _relink_duplicates(manifest, writer):
+                if source in linking:
+                    file_content, file_hash = linking[source]
+                    _apply_chunks(source, file_hash, iter_document_chunks(file_content, source), manifest, writer)
+                else:
+                    print(f"Chunks linked from {source} were removed; it will be re-synced on its next ingestion")
+            writer.flush()
+    except Exception as e:
+        record_error("ingest", e)
+        # Chunks still in the buffer were never written: force these sources
+        # to be re-synced on the next run
+        for source in writer.sources:
+            if source in manifest:
+                manifest[source]["hash"] = None
+        # The MinHash index holds them too
+        kb.dedup_index = None
+        raise
+    finally:
+        _save_manifest(kb, manifest)
+
+    if stats is not None:
+        stats.update(
+            chunks=total,
+            added=writer.added,
+            duplicates=sum(len(manifest[source].get("duplicates", {})) for source in seen if source in manifest),
         )
-        
-    return len(chunks_to_add)
+    return total
+
+def check_distinct_names(names: Iterable[str]):
+    """
+    Raises ValueError if several sources share a name: they would share one
+    manifest entry and delete each other's chunks.
+    """
+    counts = Counter(names)
+    duplicates = sorted(name for name, count in counts.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Files must have distinct names, found several of: {', '.join(duplicates)}")
+
+def _read_files(file_paths: List[str]):
+    for path in file_paths:
+        try:
+            with open(path, "rb") as f:
+                yield os.path.basename(path), f.read()
+        except Exception as e:
+            print(f"Error reading {path}: {e}")
+
+def ingest_documents(
+    file_paths: List[str],
+    prune: bool = False,
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    namespace: Optional[str] = None,
+    stats: Optional[dict] = None,
+) -> int:
+    """
+    Incrementally ingests a list of file paths into the ChromaDB collection
+    of `namespace` (defaults to DEFAULT_NAMESPACE).
+    Only new or changed chunks are embedded. With prune=True, sources that are
+    not in `file_paths` are removed from the collection. Parsing and chunking
+    fan out to `workers` processes (defaults to INGEST_WORKERS). Files are read
+    lazily and new chunks are added in batches of `batch_size` (defaults to
+    INGEST_BATCH_SIZE); `progress(batches_flushed, chunks_added)` is called
+    after every batch. If given, `stats` is filled with the counts of the run:
+    chunks (as returned), added (embedded) and duplicates (near-duplicates
+    linked instead of embedded).
+    Sources are keyed by file name, so files in different directories must
+    have distinct names; a ValueError is raised otherwise.
+    Returns the number of chunks indexed for the given files.
+    """
+    check_distinct_names(os.path.basename(path) for path in file_paths)
+    return _ingest_sources(_get_kb(namespace), _read_files(file_paths), prune, workers, batch_size, progress, stats)
 
-def ingest_uploaded_files(uploaded_files: List[tuple]) -> int:
+def ingest_uploaded_files(
+    uploaded_files: Iterable[tuple],
+    prune: bool = False,
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    namespace: Optional[str] = None,
+    stats: Optional[dict] = None,
+) -> int:
     """
-    Ingests Streamlit uploaded files (file-like objects) into the ChromaDB collection.
+    Incrementally ingests Streamlit uploaded files (file-like objects) into the ChromaDB collection.
     Args:
-        uploaded_files: List of tuples (filename, file_content_bytes)
-    Returns the number of chunks added.
+        uploaded_files: Iterable of tuples (filename, file_content_bytes)
+        prune: Remove sources that are not part of `uploaded_files`
+        workers: Parsing processes (defaults to INGEST_WORKERS)
+        batch_size: Chunks per collection.add call (defaults to INGEST_BATCH_SIZE)
+        progress: Called as progress(batches_flushed, chunks_added) after every batch
+        namespace: Knowledge base to ingest into (defaults to DEFAULT_NAMESPACE)
+        stats: Filled with the counts of the run (chunks, added, duplicates; see ingest_documents)
+    Raises ValueError before ingesting anything if several files share a name.
+    Returns the number of chunks indexed for the given files.
     """
-    global collection
-    
-    chunks_to_add = []
-    metadatas = []
-    ids = []
-    
-    for filename, file_content in uploaded_files:
-        content = parse_file_content(file_content, filename)
-        if not content:
-            continue
-            
-        file_chunks = chunk_text(content)
-        
-        for i, chunk in enumerate(file_chunks):
-            chunks_to_add.append(chunk)
-            metadatas.append({
-                "source": filename,
-                "chunk_index": i
-            })
-            ids.append(f"{filename}_{i}_{uuid.uuid4()}")
-            
-    if chunks_to_add:
-        collection.add(
-            documents=chunks_to_add,
-            metadatas=metadatas,
-            ids=ids
-        )
-        
-    return len(chunks_to_add)
+    uploaded_files = list(uploaded_files)
+    check_distinct_names(filename for filename, _ in uploaded_files)
+    return _ingest_sources(_get_kb(namespace), uploaded_files, prune, workers, batch_size, progress, stats)
 
-def clear_knowledge_base():
-    """Clears the ChromaDB collection."""
-    global collection
+def clear_knowledge_base(namespace: Optional[str] = None):
+    """Clears the ChromaDB collection of `namespace` (defaults to DEFAULT_NAMESPACE)."""
+    kb = _get_kb(namespace)
     try:
-        client.delete_collection(name="qa_agent_docs")
-        collection = client.get_or_create_collection(name="qa_agent_docs", embedding_function=sentence_transformer_ef)
+        with kb.write_lock, kb.lock:
+            store = get_vector_store()
+            try:
+                store.delete_collection(name=kb.collection_name)
+            except Exception:
+                pass  # Never created
+            kb.collection = store.get_or_create_collection(
+                name=kb.collection_name, embedding_function=get_embedding_function()
+            )
+            _save_manifest(kb, {})
+            delete_selector_index(kb.selector_index_dir)
+            if kb.lexical_index is not None:
+                kb.lexical_index.clear()
+            kb.dedup_index = None
+            _bump_generation(kb)
     except Exception as e:
         print(f"Error clearing knowledge base: {e}")
 
-def get_knowledge_base():
-    """Returns the collection (for debugging or direct access if needed)."""
-    return collection
+def get_knowledge_base(namespace: Optional[str] = None):
+    """
+    Returns the collection of `namespace` (defaults to DEFAULT_NAMESPACE),
+    creating the client, the embedding model and the collection on first use.
+    This is the single accessor for the knowledge base.
+    """
+    return _kb_collection(_get_kb(namespace))
+
+def warm_up(namespace: Optional[str] = None):
+    """
+    Optional warm-up hook: eagerly initialises the client, the embedding model
+    and the collection, e.g. at server startup or before forking workers.
+    """
+    get_knowledge_base(namespace)
+
+SNAPSHOT_VERSION = 1
+
+def export_snapshot(path: str, namespace: Optional[str] = None) -> int:
+    """
+    Writes the knowledge base of `namespace` (chunks with their embeddings,
+    manifest and selector indexes) to a snapshot file (.npz) that
+    import_snapshot can load into any vector store without re-embedding.
+    Returns the number of chunks exported.
+    """
+    kb = _get_kb(namespace)
+    with kb.write_lock:
+        collection = _kb_collection(kb)
+        ids, documents, metadatas, embeddings = [], [], [], []
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas", "embeddings"], limit=1000, offset=offset)
+            if not page["ids"]:
+                break
+            ids.extend(page["ids"])
+            documents.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+            embeddings.extend(page["embeddings"])
+            offset += len(page["ids"])
+
+        index = {
+            "version": SNAPSHOT_VERSION,
+            "embedding_model": EMBEDDING_MODEL,
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+            "manifest": _load_manifest(kb),
+            "selector_index": {source: load_selector_index(kb.selector_index_dir, source)
+                               for source in list_indexed_pages(kb.selector_index_dir)},
+        }
+    vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+    with open(path, "wb") as f:
+        np.savez(f, embeddings=vectors, index=np.frombuffer(json.dumps(index).encode("utf-8"), dtype=np.uint8))
+    return len(ids)
+
+def import_snapshot(path: str, namespace: Optional[str] = None) -> int:
+    """
+    Replaces the knowledge base of `namespace` with a snapshot written by
+    export_snapshot. Returns the number of chunks imported.
+    """
+    with np.load(path) as data:
+        index = json.loads(data["index"].tobytes().decode("utf-8"))
+        vectors = data["embeddings"]
+    if index.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {index.get('version')}")
+    if index["embedding_model"] != EMBEDDING_MODEL:
+        raise ValueError(f"Snapshot was embedded with {index['embedding_model']}, not {EMBEDDING_MODEL}")
+
+    kb = _get_kb(namespace)
+    with kb.write_lock, kb.lock:
+        store = get_vector_store()
+        try:
+            store.delete_collection(name=kb.collection_name)
+        except Exception:
+            pass  # Never created
+        kb.collection = collection = store.get_or_create_collection(
+            name=kb.collection_name, embedding_function=get_embedding_function()
+        )
+        ids = index["ids"]
+        for start in range(0, len(ids), INGEST_BATCH_SIZE):
+            end = start + INGEST_BATCH_SIZE
+            collection.add(ids=ids[start:end], documents=index["documents"][start:end],
+                           metadatas=index["metadatas"][start:end], embeddings=vectors[start:end])
+        _save_manifest(kb, index["manifest"])
+        delete_selector_index(kb.selector_index_dir)
+        for source, selector_index in index["selector_index"].items():
+            write_selector_index(kb.selector_index_dir, source, selector_index)
+        # Rebuilt from the new collection on next use
+        kb.lexical_index = None
+        kb.dedup_index = None
+        _bump_generation(kb)
+    return len(ids)
@@ -0,0 +1,79 @@
+import threading
+import contextvars
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+class Job:
+    """A unit of background work with its status, progress and outcome."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "pending"
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def update_progress(self, **fields):
+        self.progress = {**self.progress, **fields}
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+        }
+
+class JobManager:
+    """
+    Runs blocking work as background jobs on a bounded thread pool and keeps
+    track of their status. Only the most recent `max_jobs` finished jobs are kept.
+    """
+
+    def __init__(self, max_workers: int = 1, max_jobs: int = 100):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qa-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.max_jobs = max_jobs
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args, **kwargs) -> Job:
+        """Schedules fn(job, *args, **kwargs); fn can report progress via job.update_progress()."""
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        # Runs in a copy of the submitter's context (e.g. its request id)
+        self._executor.submit(contextvars.copy_context().run, self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple, kwargs: dict):
+        job.status = "running"
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = "completed"
+        except Exception as e:
+            print(f"Error in {job.kind} job {job.id}: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_jobs)]:
+            del self._jobs[job_id]
@@ -0,0 +1,41 @@
+from typing import Iterable, Iterator
+
+def iter_json_objects(pieces: Iterable[str]) -> Iterator[str]:
+    """
+    Incrementally scans streamed text for a JSON array of objects and yields
+    the raw text of each top-level object as soon as its closing brace
+    arrives. Text outside the JSON (code fences, prose) is ignored, and a
+    bare top-level object is yielded as a single item. Objects are not
+    validated here, so a malformed item only affects itself.
+    """
+    stack = []  # open containers, "[" or "{"
+    in_string = False
+    escaped = False
+    buffer = []  # text of the object being read
+
+    for piece in pieces:
+        for ch in piece:
+            if buffer:
+                buffer.append(ch)
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                continue
+
+            if ch == '"':
+                # Quotes only matter inside JSON; prose before the array is skipped
+                in_string = bool(stack)
+            elif ch in "[{":
+                if ch == "{" and not buffer and stack in ([], ["["]):
+                    buffer.append(ch)
+                stack.append(ch)
+            elif ch in "]}":
+                if stack:
+                    stack.pop()
+                if ch == "}" and buffer and stack in ([], ["["]):
+                    yield "".join(buffer)
+                    buffer = []
@@ -0,0 +1,108 @@
+import re
+import math
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Tokens keep the characters that make up identifiers, codes, paths and
+# e-mail addresses (e.g. "discountCode", "SAVE15", "/api/v1/apply-discount")
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_@$%]+(?:[-./:][A-Za-z0-9_@$%]+)*")
+_SPLIT_RE = re.compile(r"[-./:_@]+")
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased tokens; compound tokens also yield their parts."""
+    tokens = []
+    for match in _TOKEN_RE.findall(text):
+        token = match.lower()
+        tokens.append(token)
+        parts = [p for p in _SPLIT_RE.split(token) if p]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring. Stores the documents and
+    metadata it indexes so lexical hits can be served without the vector store.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._documents: Dict[str, str] = {}
+        self._metadatas: Dict[str, dict] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, ids: Iterable[str], documents: Iterable[str], metadatas: Iterable[dict]):
+        with self._lock:
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                if doc_id in self._documents:
+                    self._remove(doc_id)
+                counts = Counter(tokenize(document))
+                for term, tf in counts.items():
+                    self._postings.setdefault(term, {})[doc_id] = tf
+                length = sum(counts.values())
+                self._lengths[doc_id] = length
+                self._total_length += length
+                self._documents[doc_id] = document
+                self._metadatas[doc_id] = metadata
+
+    def update_metadata(self, ids: Iterable[str], metadatas: Iterable[dict]):
+        with self._lock:
+            for doc_id, metadata in zip(ids, metadatas):
+                if doc_id in self._metadatas:
+                    self._metadatas[doc_id] = metadata
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                if doc_id in self._documents:
+                    self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        for term in set(tokenize(self._documents.pop(doc_id))):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+        self._metadatas.pop(doc_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._lengths.clear()
+            self._documents.clear()
+            self._metadatas.clear()
+            self._total_length = 0
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Returns up to k (id, score) pairs, best first."""
+        with self._lock:
+            n = len(self._documents)
+            if not n:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def get(self, doc_id: str) -> Optional[Tuple[str, dict]]:
+        with self._lock:
+            if doc_id not in self._documents:
+                return None
+            return self._documents[doc_id], self._metadatas[doc_id]
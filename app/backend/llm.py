@@ -0,0 +1,419 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from .cache import DiskLRUCache
+from .metrics import LLM_COALESCED, LLM_RETRIES, register_cache
+from .ratelimit import RateLimiter
+
+# Backend used by the RAG pipeline: "gemini" (default) or "stub" for offline runs
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+GEMINI_MODEL = "gemini-2.0-flash"
+# Total time (seconds) spent retrying transient Gemini errors (429 / 5xx) before giving up
+LLM_RETRY_TIMEOUT = float(os.environ.get("LLM_RETRY_TIMEOUT", "60"))
+# Timeout (seconds) of a single Gemini request
+LLM_REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT", "120"))
+# Retries back off exponentially from LLM_BACKOFF_INITIAL up to LLM_BACKOFF_MAX
+# seconds, each sleep drawn uniformly below the current bound (full jitter)
+LLM_BACKOFF_INITIAL = 1.0
+LLM_BACKOFF_MAX = 30.0
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Gemini clients are pooled per API key (at most GEMINI_CLIENT_POOL_SIZE keys),
+# and requests made with one key share a token bucket of GEMINI_RATE_LIMIT
+# requests per second (0 = unlimited) across the whole process
+GEMINI_CLIENT_POOL_SIZE = int(os.environ.get("GEMINI_CLIENT_POOL_SIZE", "16"))
+GEMINI_RATE_LIMIT = float(os.environ.get("GEMINI_RATE_LIMIT", "0"))
+# Alternative endpoint and transport ("grpc" or "rest"), e.g. a local fake
+# server: GEMINI_API_ENDPOINT=http://localhost:8089 GEMINI_TRANSPORT=rest
+GEMINI_API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT")
+GEMINI_TRANSPORT = os.environ.get("GEMINI_TRANSPORT")
+
+# Persistent response cache keyed by a hash of (backend, model, prompt)
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "data/llm_cache.db")
+# Maximum number of cached responses before least-recently-used ones are evicted (0 disables the cache)
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+# Artificial latency (seconds) added by the stub backend, for benchmarks
+STUB_LLM_LATENCY = float(os.environ.get("STUB_LLM_LATENCY", "0"))
+
+class LLMBackend:
+    """Interface for text-generation backends used by the RAG pipeline."""
+
+    name = "base"
+    model_name = ""
+
+    def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """Yields the response in pieces as they are produced; by default all at once."""
+        yield self.generate(prompt)
+
+def _is_transient(e: Exception) -> bool:
+    from google.api_core import retry
+    return retry.if_transient_error(e) or getattr(e, "code", None) in TRANSIENT_STATUS_CODES
+
+def call_with_backoff(call: Callable[[], object], is_transient: Callable[[Exception], bool],
+                      on_retry: Optional[Callable[[Exception], None]] = None, timeout: float = LLM_RETRY_TIMEOUT):
+    """
+    Calls `call` until it succeeds, retrying errors for which `is_transient`
+    is true with jittered exponential backoff for up to `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    bound = LLM_BACKOFF_INITIAL
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            delay = random.uniform(0, bound)
+            if not is_transient(e) or time.monotonic() + delay > deadline:
+                raise
+            if on_retry:
+                on_retry(e)
+            time.sleep(delay)
+            bound = min(bound * 2, LLM_BACKOFF_MAX)
+
+# API key digest -> (client, rate limiter), least recently used first
+_gemini_clients: "OrderedDict[str, Tuple[object, Optional[RateLimiter]]]" = OrderedDict()
+_gemini_clients_lock = threading.Lock()
+
+def _gemini_client(api_key: str) -> Tuple[object, Optional[RateLimiter]]:
+    """
+    Returns the pooled client and rate limiter of an API key. Each client is
+    bound to its own key, so no global SDK configuration is shared between keys.
+    """
+    key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    with _gemini_clients_lock:
+        entry = _gemini_clients.get(key)
+        if entry is None:
+            # The Gemini SDK takes over a second to import, so load it on first use
+            import google.ai.generativelanguage as glm
+            client_options = {"api_key": api_key}
+            if GEMINI_API_ENDPOINT:
+                client_options["api_endpoint"] = GEMINI_API_ENDPOINT
+            client = glm.GenerativeServiceClient(client_options=client_options, transport=GEMINI_TRANSPORT)
+            entry = _gemini_clients[key] = (client, RateLimiter(GEMINI_RATE_LIMIT) if GEMINI_RATE_LIMIT > 0 else None)
+        _gemini_clients.move_to_end(key)
+        while len(_gemini_clients) > GEMINI_CLIENT_POOL_SIZE:
+            _gemini_clients.popitem(last=False)
+        return entry
+
+def _response_text(response) -> str:
+    """Text of a GenerateContentResponse (its first candidate), empty when it has none."""
+    if not response.candidates:
+        return ""
+    return "".join(part.text for part in response.candidates[0].content.parts)
+
+class GeminiBackend(LLMBackend):
+    """
+    Google Gemini, called on the pooled GenerativeServiceClient of its API
+    key. Every attempt takes a token from the key's rate limiter, and
+    transient errors (429 / 5xx) are retried with jittered backoff.
+    """
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str = GEMINI_MODEL):
+        if not api_key:
+            raise ValueError("API Key is required")
+        self.api_key = api_key
+        self.model_name = model_name
+
+    def _client(self):
+        client, rate_limiter = _gemini_client(self.api_key)
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        return client
+
+    def _request(self, prompt: str):
+        import google.ai.generativelanguage as glm
+        return glm.GenerateContentRequest(
+            model=f"models/{self.model_name}",
+            contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])],
+        )
+
+    def _on_retry(self, e: Exception):
+        LLM_RETRIES.inc(backend=self.name)
+
+    def generate(self, prompt: str) -> str:
+        request = self._request(prompt)
+
+        # Retries are handled here, not by the client
+        def attempt():
+            response = self._client().generate_content(request, retry=None, timeout=LLM_REQUEST_TIMEOUT)
+            if not response.candidates:
+                raise ValueError(f"Gemini returned no candidates: {response.prompt_feedback}")
+            return _response_text(response)
+        return call_with_backoff(attempt, _is_transient, self._on_retry)
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        request = self._request(prompt)
+
+        # Errors such as 429 surface before the first chunk; once text has been
+        # yielded the stream is not retried
+        def attempt():
+            return iter(self._client().stream_generate_content(request, retry=None, timeout=LLM_REQUEST_TIMEOUT))
+        for response in call_with_backoff(attempt, _is_transient, self._on_retry):
+            text = _response_text(response)
+            if text:
+                yield text
+
+class StubBackend(LLMBackend):
+    """
+    Deterministic local backend for offline tests and benchmarks.
+    Test-case prompts get a fixed JSON array, script prompts a minimal script.
+    """
+
+    name = "stub"
+    model_name = "stub"
+
+    # Characters per piece when streaming
+    STREAM_PIECE = 32
+
+    def __init__(self, latency: float = STUB_LLM_LATENCY):
+        self.latency = latency
+
+    def generate(self, prompt: str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(prompt)
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        # The latency is spread over the pieces, like tokens arriving from a model
+        text = self._respond(prompt)
+        pieces = [text[i:i + self.STREAM_PIECE] for i in range(0, len(text), self.STREAM_PIECE)]
+        for piece in pieces:
+            if self.latency:
+                time.sleep(self.latency / len(pieces))
+            yield piece
+
+    def _respond(self, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+
+        if "JSON array" in prompt:
+            match = re.search(r'following feature: "(.*?)"', prompt)
+            feature = match.group(1) if match else "Feature"
+            return json.dumps([
+                {
+                    "test_id": f"TC-{i:03d}",
+                    "feature": feature,
+                    "scenario": f"{feature}: {scenario}",
+                    "expected_result": expected,
+                    "grounded_in": None,
+                }
+                for i, (scenario, expected) in enumerate([
+                    ("valid input is accepted", "The action succeeds"),
+                    ("invalid input is rejected", "An error message is shown"),
+                    ("empty input is rejected", "A validation message is shown"),
+                ], start=1)
+            ])
+
+        match = re.search(r"Test Case: (.*)", prompt)
+        scenario = match.group(1).strip() if match else "test case"
+        return (
+            "# Note: Run 'python server.py' in a separate terminal before executing this script\n"
+            f"# Stub script {digest}: {scenario}\n"
+            "from selenium import webdriver\n\n"
+            "driver = webdriver.Chrome()\n"
+            'driver.get("http://localhost:8000/source.html")\n'
+            "driver.quit()\n"
+        )
+
+class RateLimitedBackend(LLMBackend):
+    """Wraps a backend so upstream calls go through a shared rate limiter."""
+
+    def __init__(self, backend: LLMBackend, rate_limiter: RateLimiter):
+        self.backend = backend
+        self.name = backend.name
+        self.model_name = backend.model_name
+        self.rate_limiter = rate_limiter
+
+    def generate(self, prompt: str) -> str:
+        self.rate_limiter.acquire()
+        return self.backend.generate(prompt)
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        self.rate_limiter.acquire()
+        yield from self.backend.generate_stream(prompt)
+
+class _Flight:
+    """An upstream call shared by concurrent identical requests."""
+
+    def __init__(self):
+        self.pieces = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.condition = threading.Condition()
+
+    def publish(self, piece: str):
+        with self.condition:
+            self.pieces.append(piece)
+            self.condition.notify_all()
+
+    def land(self, error: Optional[BaseException]):
+        with self.condition:
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+    def follow(self) -> Iterator[str]:
+        """Yields the leader's pieces as they arrive, then raises its error, if any."""
+        position = 0
+        while True:
+            with self.condition:
+                while position >= len(self.pieces) and not self.done:
+                    self.condition.wait()
+                pieces = self.pieces[position:]
+                done, error = self.done, self.error
+            yield from pieces
+            position += len(pieces)
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+# Prompt key -> in-flight call, shared by every SingleFlightBackend
+_flights: Dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+class SingleFlightBackend(LLMBackend):
+    """
+    Wraps a backend so that concurrent calls with an identical prompt (and
+    API key) share one upstream call: the first caller makes it, the others receive its
+    response (streamed as it arrives) or its error.
+    """
+
+    def __init__(self, backend: LLMBackend, api_key: Optional[str] = None):
+        self.backend = backend
+        self.name = backend.name
+        self.model_name = backend.model_name
+        # Calls are only shared between callers with the same API key, so an
+        # invalid or exhausted key never fails the calls of another one
+        self.key_digest = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+    def _join(self, prompt: str) -> Tuple[str, _Flight, bool]:
+        key = hashlib.sha256(
+            f"{self.key_digest}\0{self.name}\0{self.model_name}\0{prompt}".encode("utf-8")
+        ).hexdigest()
+        with _flights_lock:
+            flight = _flights.get(key)
+            if flight is not None:
+                LLM_COALESCED.inc(backend=self.name)
+                return key, flight, False
+            flight = _flights[key] = _Flight()
+            return key, flight, True
+
+    def _land(self, key: str, flight: _Flight, error: Optional[BaseException]):
+        with _flights_lock:
+            if _flights.get(key) is flight:
+                del _flights[key]
+        flight.land(error)
+
+    def generate(self, prompt: str) -> str:
+        key, flight, leader = self._join(prompt)
+        if not leader:
+            return "".join(flight.follow())
+        error = None
+        try:
+            text = self.backend.generate(prompt)
+            flight.publish(text)
+            return text
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._land(key, flight, error)
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        key, flight, leader = self._join(prompt)
+        if not leader:
+            yield from flight.follow()
+            return
+        # If the consumer stops early, followers get an error rather than a truncated response
+        error = RuntimeError("The shared LLM response was abandoned before it completed")
+        try:
+            for piece in self.backend.generate_stream(prompt):
+                flight.publish(piece)
+                yield piece
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._land(key, flight, error)
+
+class CachedBackend(LLMBackend):
+    """Wraps a backend with a persistent, size-bounded response cache."""
+
+    def __init__(self, backend: LLMBackend, cache: DiskLRUCache):
+        self.backend = backend
+        self.name = backend.name
+        self.model_name = backend.model_name
+        self._cache = cache
+
+    def _key(self, prompt: str) -> str:
+        return hashlib.sha256(f"{self.name}\0{self.model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def generate(self, prompt: str) -> str:
+        key = self._key(prompt)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached.decode("utf-8")
+
+        text = self.backend.generate(prompt)
+        self._cache.set(key, text.encode("utf-8"))
+        return text
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        key = self._key(prompt)
+        cached = self._cache.get(key)
+        if cached is not None:
+            yield cached.decode("utf-8")
+            return
+
+        # Only complete responses are cached
+        pieces = []
+        for piece in self.backend.generate_stream(prompt):
+            pieces.append(piece)
+            yield piece
+        self._cache.set(key, "".join(pieces).encode("utf-8"))
+
+_response_cache: Optional[DiskLRUCache] = None
+_response_cache_lock = threading.Lock()
+
+def _get_response_cache() -> DiskLRUCache:
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = DiskLRUCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES)
+                register_cache("llm_response", _response_cache)
+    return _response_cache
+
+def get_backend(api_key: Optional[str] = None, use_cache: bool = True,
+                rate_limiter: Optional[RateLimiter] = None) -> LLMBackend:
+    """
+    Returns the configured LLM backend (see LLM_BACKEND), wrapped with the
+    response cache unless `use_cache` is False or the cache is disabled.
+    With a `rate_limiter`, upstream calls (cache misses) are throttled.
+    Identical prompts in flight at the same time share one upstream call.
+    """
+    if LLM_BACKEND == "stub":
+        backend = StubBackend()
+    elif LLM_BACKEND == "gemini":
+        backend = GeminiBackend(api_key)
+    else:
+        raise ValueError(f"Unknown LLM backend: {LLM_BACKEND}")
+
+    if rate_limiter is not None:
+        backend = RateLimitedBackend(backend, rate_limiter)
+    backend = SingleFlightBackend(backend, api_key)
+    if not use_cache or LLM_CACHE_MAX_ENTRIES <= 0:
+        return backend
+    return CachedBackend(backend, _get_response_cache())
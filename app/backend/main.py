@@ -1,68 +1,281 @@
 import os
-import shutil
-from typing import List
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import json
+import time
+import asyncio
+import weakref
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from .ingestion import ingest_documents, clear_knowledge_base
-from .rag import generate_test_cases, generate_selenium_script
-from .models import TestCaseRequest, TestCase, ScriptRequest, ScriptResponse
+from .ingestion import check_distinct_names, ingest_uploaded_files, normalize_namespace, warm_up
+from .jobs import JobManager
+from . import metrics
+from .rag import generate_test_cases, stream_test_cases, generate_selenium_script, generate_selenium_scripts
+from .models import (
+    TestCaseRequest, TestCase, ScriptRequest, ScriptResponse, JobStatus,
+    BatchScriptRequest, BatchScriptResult,
+)
 
-app = FastAPI(title="Autonomous QA Agent API")
+# Blocking work (retrieval, LLM calls) runs on a bounded pool so it never
+# stalls the event loop
+API_BLOCKING_WORKERS = int(os.environ.get("API_BLOCKING_WORKERS", "8"))
+_executor = ThreadPoolExecutor(max_workers=API_BLOCKING_WORKERS, thread_name_prefix="qa-api")
 
+# Concurrent ingestion jobs; jobs for the same namespace still run one at a
+# time since they share its upload dir and manifest
+INGEST_JOB_WORKERS = int(os.environ.get("INGEST_JOB_WORKERS", "2"))
+ingestion_jobs = JobManager(max_workers=INGEST_JOB_WORKERS)
+# Weak values: a lock lives as long as a job holds it, so namespaces without a
+# running job do not accumulate locks
+_namespace_locks = weakref.WeakValueDictionary()
+_namespace_locks_lock = threading.Lock()
+
+def _namespace_lock(namespace: str) -> threading.Lock:
+    with _namespace_locks_lock:
+        lock = _namespace_locks.get(namespace)
+        if lock is None:
+            lock = _namespace_locks[namespace] = threading.Lock()
+        return lock
+
+def _namespace(namespace: Optional[str]) -> str:
+    try:
+        return normalize_namespace(namespace)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Run in a copy of the request context so metrics logs keep the request id
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, fn, *args, **kwargs))
+
+_EXHAUSTED = object()
+
+async def _iterate_blocking(iterator):
+    """
+    Async iterator over a blocking iterator: every step (retrieval, LLM calls)
+    runs on the bounded pool, like _run_blocking, instead of Starlette's own
+    threadpool.
+    """
+    try:
+        while True:
+            item = await _run_blocking(next, iterator, _EXHAUSTED)
+            if item is _EXHAUSTED:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            try:
+                await _run_blocking(close)
+            except ValueError:
+                pass  # Still running a step (the request was cancelled); closed when collected
+
+# Set WARMUP_ON_STARTUP=1 to load the embedding model and open the knowledge base
+# at startup instead of on the first request that needs them
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "0") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_ON_STARTUP:
+        await _run_blocking(warm_up)
+    yield
+
+app = FastAPI(title="Autonomous QA Agent API", lifespan=lifespan)
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Assigns a request id (X-Request-ID, generated if absent) and records request latency."""
+    request_id = request.headers.get("x-request-id") or metrics.new_request_id()
+    token = metrics.set_request_id(request_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        metrics.HTTP_SECONDS.observe(elapsed, method=request.method, route=route_path, status=str(status))
+        metrics.log_event("request", method=request.method, route=route_path, status=status,
+                          seconds=round(elapsed, 6))
+        metrics.reset_request_id(token)
+
+# Uploads are ingested straight from memory; raw files are only written to
+# UPLOAD_DIR/<namespace> when the request asks for it (persist=true)
 UPLOAD_DIR = "uploaded_files"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Upload size limits in bytes, per file and per request (0 = unlimited)
+MAX_UPLOAD_FILE_BYTES = int(os.environ.get("MAX_UPLOAD_FILE_BYTES", str(20 * 1024 * 1024)))
+MAX_UPLOAD_TOTAL_BYTES = int(os.environ.get("MAX_UPLOAD_TOTAL_BYTES", str(100 * 1024 * 1024)))
 
 class IngestResponse(BaseModel):
     message: str
-    chunks_processed: int
-
-@app.post("/upload_files", response_model=IngestResponse)
-async def upload_files(files: List[UploadFile] = File(...)):
-    file_paths = []
-    # Clear previous knowledge base to keep it fresh for the demo
-    clear_knowledge_base()
-    
-    # Clean upload dir
-    for f in os.listdir(UPLOAD_DIR):
-        os.remove(os.path.join(UPLOAD_DIR, f))
+    job_id: str
+
+def _persist_uploads(file_data: List[tuple], namespace: str):
+    # Replaces the namespace's upload dir with the raw uploaded files
+    upload_dir = os.path.join(UPLOAD_DIR, namespace)
+    os.makedirs(upload_dir, exist_ok=True)
+    for f in os.listdir(upload_dir):
+        os.remove(os.path.join(upload_dir, f))
+
+    for filename, content in file_data:
+        with open(os.path.join(upload_dir, filename), "wb") as buffer:
+            buffer.write(content)
+
+def _ingest_job(job, file_data: List[tuple], namespace: str, persist: bool) -> dict:
+    with _namespace_lock(namespace):
+        if persist:
+            _persist_uploads(file_data, namespace)
+
+        job.update_progress(namespace=namespace, files=len(file_data), batches=0, chunks_added=0)
+        # Incremental rebuild: only changed chunks are embedded, sources that
+        # were not re-uploaded are pruned from the knowledge base
+        stats = {}
+        num_chunks = ingest_uploaded_files(
+            file_data,
+            prune=True,
+            progress=lambda batches, added: job.update_progress(batches=batches, chunks_added=added),
+            namespace=namespace,
+            stats=stats,
+        )
+    return {"chunks_processed": num_chunks, "chunks_added": stats["added"], "duplicates_removed": stats["duplicates"]}
+
+async def _read_upload(file: UploadFile, limit: Optional[int]) -> bytes:
+    """Reads an upload's spooled bytes once; raises 413 when it is larger than `limit`."""
+    # The multipart parser records the size, so oversized files are rejected before reading them
+    if limit is not None and file.size is not None and file.size > limit:
+        raise HTTPException(status_code=413, detail=f"{file.filename} exceeds the upload size limit")
+    content = await file.read(-1 if limit is None else limit + 1)
+    if limit is not None and len(content) > limit:
+        raise HTTPException(status_code=413, detail=f"{file.filename} exceeds the upload size limit")
+    return content
 
+@app.post("/upload_files", response_model=IngestResponse, status_code=202)
+async def upload_files(files: List[UploadFile] = File(...), namespace: Optional[str] = Form(None),
+                       persist: bool = Form(False)):
+    """
+    Starts ingesting the uploads from memory. With persist=true the raw files
+    are also kept in the namespace's upload dir.
+    """
+    namespace = _namespace(namespace)
+    # Read the uploads before responding; the UploadFile handles are closed afterwards
+    file_data = []
+    total = 0
     for file in files:
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        file_paths.append(file_path)
-    
+        limits = [MAX_UPLOAD_FILE_BYTES] if MAX_UPLOAD_FILE_BYTES > 0 else []
+        if MAX_UPLOAD_TOTAL_BYTES > 0:
+            limits.append(MAX_UPLOAD_TOTAL_BYTES - total)
+        content = await _read_upload(file, min(limits) if limits else None)
+        total += len(content)
+        file_data.append((os.path.basename(file.filename), content))
     try:
-        num_chunks = ingest_documents(file_paths)
-        return {"message": "Knowledge Base Built Successfully", "chunks_processed": num_chunks}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        check_distinct_names(filename for filename, _ in file_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job = ingestion_jobs.submit("ingestion", _ingest_job, file_data, namespace, persist)
+    return {"message": "Knowledge Base build started", "job_id": job.id}
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint: stage latencies, chunk/token counts, cache hit rates, LLM retries."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/generate_test_cases", response_model=List[TestCase])
 async def generate_tests(request: TestCaseRequest):
+    namespace = _namespace(request.namespace)
+    try:
+        return await _run_blocking(generate_test_cases, request.query, request.api_key, namespace=namespace)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+@app.post("/generate_test_cases/stream")
+async def generate_tests_stream(request: TestCaseRequest):
+    """
+    Streams test cases as Server-Sent Events while the model is still
+    generating: one `test_case` event per test case (a TestCase as JSON),
+    then `done` with the count, or `error` if generation fails midway.
+    """
+    namespace = _namespace(request.namespace)
     try:
-        return generate_test_cases(request.query, request.api_key)
+        test_cases = stream_test_cases(request.query, request.api_key, namespace=namespace)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    async def stream():
+        count = 0
+        try:
+            async for test_case in _iterate_blocking(test_cases):
+                count += 1
+                yield _sse("test_case", test_case.model_dump_json())
+        except Exception as e:
+            metrics.record_error("generate_test_cases_stream", e)
+            yield _sse("error", json.dumps({"detail": str(e)}))
+            return
+        yield _sse("done", json.dumps({"count": count}))
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def _generate_script(request: ScriptRequest) -> str:
+    # Without HTML content in the request, the selector index built from the
+    # uploaded pages at ingestion time is used
+    return generate_selenium_script(
+        request.test_case, request.html_content or "", request.api_key, namespace=request.namespace
+    )
+
 @app.post("/generate_script", response_model=ScriptResponse)
 async def generate_script(request: ScriptRequest):
+    _namespace(request.namespace)
     try:
-        # If HTML content is not provided in request, try to find it in uploads
-        html_content = request.html_content
-        if not html_content:
-            # Look for html file in uploads
-            for f in os.listdir(UPLOAD_DIR):
-                if f.endswith(".html"):
-                    with open(os.path.join(UPLOAD_DIR, f), "r", encoding="utf-8") as file:
-                        html_content = file.read()
-                    break
-        
-        script = generate_selenium_script(request.test_case, html_content or "", request.api_key)
+        script = await _run_blocking(_generate_script, request)
         return {"script_code": script}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/generate_scripts")
+async def generate_scripts(request: BatchScriptRequest):
+    """
+    Generates scripts for a whole test plan concurrently and streams one
+    BatchScriptResult per line (NDJSON) as each script finishes.
+    """
+    namespace = _namespace(request.namespace)
+    try:
+        results = generate_selenium_scripts(
+            request.test_cases,
+            request.html_content or "",
+            request.api_key,
+            max_concurrency=request.max_concurrency,
+            rate_limit=request.rate_limit,
+            namespace=namespace,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def stream():
+        async for index, script in _iterate_blocking(results):
+            result = BatchScriptResult(index=index, test_id=request.test_cases[index].test_id, script_code=script)
+            yield result.model_dump_json() + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Dependency-free metrics registry for the hot paths (ingestion, retrieval,
+# generation), rendered in the Prometheus text format by GET /metrics.
+
+# Set STRUCTURED_LOGS=1 to emit one JSON line per stage timing and error on
+# stderr, tagged with the id of the request being served
+STRUCTURED_LOGS = os.environ.get("STRUCTURED_LOGS", "0") == "1"
+
+# Histogram buckets in seconds, from sub-millisecond lookups to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Buckets for chunk and token counts
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def set_request_id(request_id: Optional[str]):
+    """Tags metrics logs emitted by the current context (e.g. an HTTP request) with `request_id`."""
+    return _request_id.set(request_id)
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[Tuple[str, tuple, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, key, value
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> Iterator[Tuple[str, tuple, float]]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            for bound, count in zip(self.buckets + (float("inf"),), state[:len(self.buckets)] + [state[-1]]):
+                yield self.name + "_bucket", key + (("le", _format_value(bound)),), count
+            yield self.name + "_sum", key, state[-2]
+            yield self.name + "_count", key, state[-1]
+
+_metrics: List = []
+# name -> object with `hits` and `misses` attributes
+_caches: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+def counter(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    metric = Counter(name, documentation, labelnames)
+    with _registry_lock:
+        _metrics.append(metric)
+    return metric
+
+def histogram(name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+              buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+    metric = Histogram(name, documentation, labelnames, buckets)
+    with _registry_lock:
+        _metrics.append(metric)
+    return metric
+
+def register_cache(name: str, cache):
+    """Exposes the `hits` / `misses` counters of a cache under `name`."""
+    with _registry_lock:
+        _caches[name] = cache
+
+STAGE_SECONDS = histogram("qa_stage_seconds", "Latency of pipeline stages", ("stage",))
+ERRORS = counter("qa_errors_total", "Errors caught in pipeline stages", ("stage",))
+HTTP_SECONDS = histogram("qa_http_request_seconds", "HTTP request latency", ("method", "route", "status"))
+INGEST_CHUNKS = counter("qa_ingest_chunks_total", "Chunks processed by ingestion by outcome", ("result",))
+CONTEXT_CHUNKS = histogram("qa_context_chunks", "Chunks retrieved per query", ("mode",), COUNT_BUCKETS)
+CONTEXT_TOKENS = histogram("qa_context_tokens", "Estimated tokens of assembled context", (), COUNT_BUCKETS)
+LLM_REQUESTS = counter("qa_llm_requests_total", "LLM generations by kind and outcome", ("kind", "outcome"))
+LLM_TOKENS = counter("qa_llm_tokens_total", "Estimated LLM tokens by direction", ("direction",))
+LLM_RETRIES = counter("qa_llm_retries_total", "Upstream LLM calls retried after a transient error", ("backend",))
+LLM_COALESCED = counter("qa_llm_coalesced_total", "LLM calls served by an identical in-flight call", ("backend",))
+
+def log_event(event: str, **fields):
+    """Writes a structured JSON log line when STRUCTURED_LOGS is enabled."""
+    if not STRUCTURED_LOGS:
+        return
+    record = {"ts": round(time.time(), 3), "event": event, "request_id": get_request_id()}
+    record.update(fields)
+    print(json.dumps(record, default=str), file=sys.stderr, flush=True)
+
+def record_error(stage: str, error: BaseException):
+    ERRORS.inc(stage=stage)
+    log_event("error", stage=stage, error=f"{type(error).__name__}: {error}")
+
+def observe_stage(stage: str, start: float):
+    """Records the time since `start` (a time.perf_counter() value) as a `stage` latency sample."""
+    elapsed = time.perf_counter() - start
+    STAGE_SECONDS.observe(elapsed, stage=stage)
+    log_event("stage", stage=stage, seconds=round(elapsed, 6))
+
+@contextmanager
+def timed(stage: str):
+    """Records the duration of the enclosed block as a `stage` latency sample."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, start)
+
+def render() -> str:
+    """Renders every metric in the Prometheus text exposition format."""
+    lines = []
+    with _registry_lock:
+        metrics = list(_metrics)
+        caches = dict(_caches)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    cache_samples: List[Tuple[str, str, str, Callable]] = [
+        ("qa_cache_hits_total", "counter", "Cache hits", lambda c: c.hits),
+        ("qa_cache_misses_total", "counter", "Cache misses", lambda c: c.misses),
+        ("qa_cache_hit_ratio", "gauge", "Cache hit ratio since start",
+         lambda c: c.hits / (c.hits + c.misses) if c.hits + c.misses else 0.0),
+    ]
+    for name, kind, documentation, read in cache_samples:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        for cache_name, cache in sorted(caches.items()):
+            lines.append(f"{name}{_format_labels((('cache', cache_name),))} {_format_value(read(cache))}")
+    return "\n".join(lines) + "\n"
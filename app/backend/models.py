@@ -1,9 +1,10 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 class TestCaseRequest(BaseModel):
     query: str
     api_key: str
+    namespace: Optional[str] = None
 
 class TestCase(BaseModel):
     test_id: str
@@ -19,6 +20,28 @@ class ScriptRequest(BaseModel):
     test_case: TestCase
     html_content: Optional[str] = None
     api_key: str
+    namespace: Optional[str] = None
 
 class ScriptResponse(BaseModel):
     script_code: str
+
+class BatchScriptRequest(BaseModel):
+    test_cases: List[TestCase]
+    html_content: Optional[str] = None
+    api_key: str
+    max_concurrency: Optional[int] = None
+    rate_limit: Optional[float] = None
+    namespace: Optional[str] = None
+
+class BatchScriptResult(BaseModel):
+    index: int
+    test_id: str
+    script_code: str
+
+class JobStatus(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    progress: Dict[str, Any] = {}
+    result: Optional[Any] = None
+    error: Optional[str] = None
@@ -1,30 +1,317 @@
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .models import TestCase
-from .ingestion import get_knowledge_base
-import google.generativeai as genai
+from .cache import LRUCache
+from .dom_index import page_selectors
+from .chunking import estimate_tokens
+from .ingestion import (
+    get_knowledge_base, get_embedding_function, get_lexical_index, get_kb_generation, selector_index_dir,
+)
+from .llm import LLMBackend, RateLimitedBackend, get_backend
+from .ratelimit import CombinedRateLimiter, RateLimiter
+from .jsonstream import iter_json_objects
+from .metrics import (
+    timed, observe_stage, record_error, register_cache, CONTEXT_CHUNKS, CONTEXT_TOKENS, LLM_REQUESTS, LLM_TOKENS,
+)
 import json
 import os
+import re
+import time
+import contextvars
+import numpy as np
 
-def retrieve_context(query: str, n_results: int = 5) -> str:
-    """Retrieves relevant context from ChromaDB."""
-    collection = get_knowledge_base()
+# Retrieval mode: "hybrid" (BM25 + vector hits fused with reciprocal rank
+# fusion), "vector", "lexical" (BM25 only, no query embedding) or "multi"
+# (hybrid over several expansions of the query, see MULTI_QUERY_TEMPLATES)
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
+# Retrieval mode used for test-case generation, where a broad feature name
+# has to reach spec, UI/UX and API chunks alike
+TEST_CASE_RETRIEVAL_MODE = os.environ.get("TEST_CASE_RETRIEVAL_MODE", "multi")
+RRF_K = 60
+# Queries naming exact things (quoted strings, paths, #ids, camelCase
+# identifiers, codes mixing letters and digits) take the lexical fast path
+_EXACT_QUERY_RE = re.compile(r'"[^"]+"|(?<!\w)/\w[\w/.-]*|#\w+|\b[a-z]+[A-Z]\w*|\b(?=\w*\d)(?=\w*[A-Za-z])\w+')
+
+# Context assembly: candidates fetched per query, the token budget the assembled
+# context may fill and the MMR trade-off (1 = pure relevance, 0 = pure diversity)
+CONTEXT_CANDIDATES = int(os.environ.get("CONTEXT_CANDIDATES", "20"))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))
+MMR_LAMBDA = float(os.environ.get("MMR_LAMBDA", "0.5"))
+# Bounds on the text shared by neighbouring chunks (the fixed chunker overlaps
+# by 200, structure chunks do not overlap): a shorter common suffix / prefix is
+# a coincidence, e.g. "discount code" + "codes", and is kept
+MAX_CHUNK_OVERLAP = 400
+MIN_CHUNK_OVERLAP = 50
+
+# "multi" mode: sub-queries a feature is expanded into, one per angle. They are
+# embedded in one batch and searched with one batched vector query.
+MULTI_QUERY_TEMPLATES = (
+    "{query}",
+    "{query} business rules, validation and edge cases",
+    "{query} UI elements, labels and error messages",
+    "{query} API endpoint, request and response",
+)
+
+# Retrieval cache: (kb generation, query, budget) -> passages. Any change to
+# the knowledge base bumps the generation, so stale context is never served.
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", "256"))
+RETRIEVAL_CACHE_TTL = float(os.environ.get("RETRIEVAL_CACHE_TTL", "600"))
+_retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+register_cache("retrieval", _retrieval_cache)
+
+# Formatted selector indexes of the ingested pages, per knowledge-base generation,
+# so script generation does not read every page's index from disk per request
+_selector_cache = LRUCache(64)
+register_cache("page_selectors", _selector_cache)
+
+# Batch script generation: concurrent LLM calls per batch and upstream requests
+# per second (0 = unlimited). Both are upper bounds for client requests, and the
+# rate limit is shared by every batch in the process.
+SCRIPT_BATCH_CONCURRENCY = int(os.environ.get("SCRIPT_BATCH_CONCURRENCY", "4"))
+LLM_RATE_LIMIT = float(os.environ.get("LLM_RATE_LIMIT", "0"))
+_batch_rate_limiter = RateLimiter(LLM_RATE_LIMIT) if LLM_RATE_LIMIT > 0 else None
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def _mmr_order(relevance, embeddings, lambda_mult: float) -> List[int]:
+    """Orders candidates by maximal marginal relevance given their relevance scores."""
+    relevance = np.asarray(relevance, dtype=np.float32)
+    vectors = _normalize(embeddings)
+    similarity = vectors @ vectors.T
+    order = [int(np.argmax(relevance))]
+    remaining = [i for i in range(len(relevance)) if i != order[0]]
+    while remaining:
+        redundancy = similarity[np.ix_(remaining, order)].max(axis=1)
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        best = remaining[int(np.argmax(scores))]
+        order.append(best)
+        remaining.remove(best)
+    return order
+
+def _merge_overlap(first: str, second: str) -> str:
+    """Joins two neighbouring chunks, dropping the text they share."""
+    for k in range(min(len(first), len(second), MAX_CHUNK_OVERLAP), MIN_CHUNK_OVERLAP - 1, -1):
+        if first.endswith(second[:k]):
+            return first + second[k:]
+    return first + "\n\n" + second
+
+def _assemble(selected: List[dict]) -> List[str]:
+    """
+    Merges selected chunks that are neighbours in the same source into single
+    passages. Passages keep the rank of their best chunk.
+    """
+    groups = {}
+    for rank, chunk in enumerate(selected):
+        groups.setdefault(chunk["source"], []).append((chunk["chunk_index"], rank, chunk["document"]))
+
+    passages = []
+    for source, chunks in groups.items():
+        chunks.sort()
+        run_index, run_rank, run_text = chunks[0]
+        for index, rank, text in chunks[1:]:
+            if index == run_index + 1:
+                run_text = _merge_overlap(run_text, text)
+                run_rank = min(run_rank, rank)
+            else:
+                passages.append((run_rank, f"[{source}]\n{run_text}"))
+                run_rank, run_text = rank, text
+            run_index = index
+        passages.append((run_rank, f"[{source}]\n{run_text}"))
+    return [text for _, text in sorted(passages)]
+
+def assemble_context(candidates: List[dict], order: List[int], token_budget: int,
+                     max_chunks: Optional[int] = None) -> List[str]:
+    """
+    Context-assembly stage: walks candidate chunks ({"document", "metadata"})
+    in `order` and greedily adds them while the merged passages fit in
+    `token_budget` tokens.
+    """
+    chunks = [
+        {
+            "document": candidate["document"],
+            "source": (candidate["metadata"] or {}).get("source", "unknown"),
+            "chunk_index": (candidate["metadata"] or {}).get("chunk_index", i),
+        }
+        for i, candidate in enumerate(candidates)
+    ]
+
+    selected = []
+    passages = []
+    for i in order:
+        attempt = _assemble(selected + [chunks[i]])
+        if sum(estimate_tokens(p) for p in attempt) > token_budget:
+            continue
+        selected.append(chunks[i])
+        passages = attempt
+        if max_chunks and len(selected) >= max_chunks:
+            break
+    return passages
+
+def _vector_search_many(queries: List[str], n: int, namespace: Optional[str] = None) -> tuple:
+    """Embeds `queries` in one batch and searches them with one batched query; returns (embeddings, hit lists)."""
+    with timed("embed_query"):
+        query_embeddings = get_embedding_function()(queries)
+    with timed("vector_query"):
+        results = get_knowledge_base(namespace).query(
+            query_embeddings=list(query_embeddings),
+            n_results=n,
+            include=["documents", "metadatas", "embeddings"],
+        )
+    hit_lists = []
+    for q in range(len(queries)):
+        hits = []
+        if results and results['ids'] and q < len(results['ids']):
+            for doc_id, document, metadata, embedding in zip(
+                results['ids'][q], results['documents'][q], results['metadatas'][q], results['embeddings'][q]
+            ):
+                hits.append({"id": doc_id, "document": document, "metadata": metadata, "embedding": embedding})
+        hit_lists.append(hits)
+    return query_embeddings, hit_lists
+
+def _vector_search(query: str, n: int, namespace: Optional[str] = None) -> tuple:
+    query_embeddings, hit_lists = _vector_search_many([query], n, namespace)
+    return query_embeddings[0], hit_lists[0]
+
+def _lexical_search(query: str, n: int, namespace: Optional[str] = None) -> List[dict]:
+    index = get_lexical_index(namespace)
+    hits = []
+    with timed("lexical_search"):
+        results = index.search(query, n)
+    for doc_id, score in results:
+        found = index.get(doc_id)
+        if found is not None:
+            hits.append({"id": doc_id, "document": found[0], "metadata": found[1], "score": score})
+    return hits
+
+def expand_query(query: str) -> List[str]:
+    """Sub-queries searched for `query` in "multi" mode."""
+    return [template.format(query=query) for template in MULTI_QUERY_TEMPLATES]
+
+def _hybrid_candidates(query: str, n: int, namespace: Optional[str] = None) -> tuple:
+    """Fuses vector and BM25 hits with reciprocal rank fusion; returns (candidates, order)."""
+    query_embedding, vector_hits = _vector_search(query, n, namespace)
+    lexical_hits = _lexical_search(query, n, namespace)
+    return _fuse([vector_hits, lexical_hits], namespace)
+
+def _multi_query_candidates(query: str, n: int, namespace: Optional[str] = None) -> tuple:
+    """
+    Hybrid retrieval over the expansions of `query`: the vector hits of every
+    sub-query and the BM25 hits of the query itself, de-duplicated and fused.
+    """
+    _, vector_hit_lists = _vector_search_many(expand_query(query), n, namespace)
+    # The expansions' generic words would only add noise to BM25
+    lexical_hits = _lexical_search(query, n, namespace)
+    return _fuse(vector_hit_lists + [lexical_hits], namespace)
+
+def _fuse(hit_lists: List[List[dict]], namespace: Optional[str] = None) -> tuple:
+    """Fuses ranked hit lists with reciprocal rank fusion, then orders them by MMR; returns (candidates, order)."""
+    fused = {}
+    candidates = {}
+    for hits in hit_lists:
+        for rank, hit in enumerate(hits):
+            fused[hit["id"]] = fused.get(hit["id"], 0.0) + 1.0 / (RRF_K + rank + 1)
+            candidates.setdefault(hit["id"], hit)
+    if not candidates:
+        return [], []
+
+    # Lexical-only hits need their stored embedding for the diversity term
+    missing = [doc_id for doc_id, hit in candidates.items() if hit.get("embedding") is None]
+    if missing:
+        found = get_knowledge_base(namespace).get(ids=missing, include=["embeddings"])
+        for doc_id, embedding in zip(found["ids"], found["embeddings"]):
+            candidates[doc_id]["embedding"] = embedding
+    ranked = [hit for hit in candidates.values() if hit.get("embedding") is not None]
+    if not ranked:
+        return [], []
+
+    relevance = np.array([fused[hit["id"]] for hit in ranked])
+    order = _mmr_order(relevance / relevance.max(), [hit["embedding"] for hit in ranked], MMR_LAMBDA)
+    return ranked, order
+
+def _retrieve(query: str, n: int, mode: str, namespace: Optional[str] = None) -> tuple:
+    """Returns (candidates, order) for the given retrieval mode."""
+    if mode == "hybrid" and _EXACT_QUERY_RE.search(query):
+        # Fast path: exact identifiers are found lexically, skip query embedding
+        lexical_hits = _lexical_search(query, n, namespace)
+        if lexical_hits:
+            return lexical_hits, list(range(len(lexical_hits)))
+
+    if mode == "lexical":
+        hits = _lexical_search(query, n, namespace)
+        return hits, list(range(len(hits)))
+    if mode == "vector":
+        query_embedding, hits = _vector_search(query, n, namespace)
+        if not hits:
+            return [], []
+        embeddings = [hit["embedding"] for hit in hits]
+        relevance = _normalize(embeddings) @ _normalize(query_embedding)[0]
+        return hits, _mmr_order(relevance, embeddings, MMR_LAMBDA)
+    if mode == "multi":
+        return _multi_query_candidates(query, n, namespace)
+    return _hybrid_candidates(query, n, namespace)
+
+def retrieve_context(query: str, n_results: Optional[int] = None, token_budget: Optional[int] = None,
+                     mode: Optional[str] = None, namespace: Optional[str] = None) -> str:
+    """
+    Retrieves relevant context from the knowledge base of `namespace`
+    (defaults to the default namespace), assembled to fit a
+    token budget (defaults to CONTEXT_TOKEN_BUDGET); `n_results` optionally
+    caps the number of chunks used. `mode` is "hybrid", "vector", "lexical"
+    or "multi" (defaults to RETRIEVAL_MODE). Results are cached per knowledge-base generation.
+    """
+    token_budget = token_budget or CONTEXT_TOKEN_BUDGET
+    mode = mode or RETRIEVAL_MODE
+    # Read the generation before querying so a concurrent rebuild can only
+    # make this entry unreachable, never stale. Generations are unique across
+    # namespaces, so the key needs no namespace.
+    cache_key = (get_kb_generation(namespace), query, n_results, token_budget, mode)
+    passages = _retrieval_cache.get(cache_key)
+    if passages is None:
+        try:
+            with timed("retrieve"):
+                candidates, order = _retrieve(query, max(CONTEXT_CANDIDATES, n_results or 0), mode, namespace)
+            with timed("assemble_context"):
+                passages = assemble_context(candidates, order, token_budget, n_results)
+            CONTEXT_CHUNKS.observe(len(candidates), mode=mode)
+            CONTEXT_TOKENS.observe(sum(estimate_tokens(p) for p in passages))
+            _retrieval_cache.set(cache_key, passages)
+        except Exception as e:
+            record_error("retrieve", e)
+            print(f"Error retrieving context: {e}")
+            return ""
+    return "\n\n".join(passages)
+
+def _page_selectors(html_content: str, namespace: Optional[str]) -> str:
+    if html_content:
+        # Cached by content hash
+        return page_selectors(selector_index_dir(namespace), html_content)
+    # Read before loading, like the retrieval cache key
+    generation = get_kb_generation(namespace)
+    selectors = _selector_cache.get(generation)
+    if selectors is None:
+        selectors = page_selectors(selector_index_dir(namespace))
+        _selector_cache.set(generation, selectors)
+    return selectors
+
+def _call_llm(backend: LLMBackend, prompt: str, kind: str) -> str:
+    """Calls the LLM, recording its latency, estimated token counts and the outcome."""
+    LLM_TOKENS.inc(estimate_tokens(prompt), direction="prompt")
     try:
-        results = collection.query(query_texts=[query], n_results=n_results)
-        if results and results['documents']:
-            return "\n\n".join(results['documents'][0])
-    except Exception as e:
-        print(f"Error retrieving context: {e}")
-    return ""
-
-def generate_test_cases(query: str, api_key: str) -> List[TestCase]:
-    if not api_key:
-        raise ValueError("API Key is required")
-        
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
-    context = retrieve_context(query)
+        with timed("llm"):
+            text = backend.generate(prompt)
+    except Exception:
+        LLM_REQUESTS.inc(kind=kind, outcome="error")
+        raise
+    LLM_REQUESTS.inc(kind=kind, outcome="ok")
+    LLM_TOKENS.inc(estimate_tokens(text), direction="completion")
+    return text
+
+def _test_case_prompt(query: str, namespace: Optional[str] = None) -> str:
+    context = retrieve_context(query, mode=TEST_CASE_RETRIEVAL_MODE, namespace=namespace)
     
+    start = time.perf_counter()
     prompt = f"""
     You are an expert QA Automation Engineer. 
     Your task is to generate comprehensive test cases for the following feature: "{query}".
@@ -43,33 +330,95 @@ def generate_test_cases(query: str, api_key: str) -> List[TestCase]:
     
     JSON Output:
     """
+    observe_stage("build_prompt", start)
+    return prompt
+
+def _parse_test_cases(pieces: Iterable[str]) -> Iterator[TestCase]:
+    """
+    Yields test cases from (streamed) response text as each JSON object
+    completes. Malformed items are skipped without discarding the others.
+    """
+    for raw in iter_json_objects(pieces):
+        try:
+            yield TestCase(**json.loads(raw))
+        except Exception as e:
+            record_error("parse_test_case", e)
+            print(f"Skipping malformed test case: {e}")
+
+def generate_test_cases(query: str, api_key: str, backend: Optional[LLMBackend] = None,
+                        namespace: Optional[str] = None) -> List[TestCase]:
+    """
+    Generates grounded test cases for a feature from the knowledge base of
+    `namespace`. `backend` defaults to the configured LLM backend (see
+    app.backend.llm.get_backend).
+    """
+    if backend is None:
+        backend = get_backend(api_key)
+    
+    prompt = _test_case_prompt(query, namespace)
     
     try:
-        response = model.generate_content(prompt)
-        text = response.text
-        # Clean up code blocks if present
-        if text.startswith("```json"):
-            text = text[7:]
-        if text.endswith("```"):
-            text = text[:-3]
-        text = text.strip()
-        
-        data = json.loads(text)
-        return [TestCase(**item) for item in data]
+        text = _call_llm(backend, prompt, "test_cases")
+        with timed("parse_response"):
+            return list(_parse_test_cases([text]))
     except Exception as e:
+        record_error("generate_test_cases", e)
         print(f"Error generating test cases: {e}")
         return []
 
-def generate_selenium_script(test_case: TestCase, html_content: str, api_key: str) -> str:
-    if not api_key:
-        raise ValueError("API Key is required")
-        
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
+def _iter_test_cases(query: str, backend: LLMBackend, namespace: Optional[str]) -> Iterator[TestCase]:
+    prompt = _test_case_prompt(query, namespace)
+    LLM_TOKENS.inc(estimate_tokens(prompt), direction="prompt")
+    start = time.perf_counter()
+    received = []
+
+    def pieces():
+        for piece in backend.generate_stream(prompt):
+            received.append(piece)
+            yield piece
+
+    try:
+        for count, test_case in enumerate(_parse_test_cases(pieces())):
+            if count == 0:
+                observe_stage("first_test_case", start)
+            yield test_case
+    except Exception:
+        LLM_REQUESTS.inc(kind="test_cases_stream", outcome="error")
+        raise
+    observe_stage("llm_stream", start)
+    LLM_REQUESTS.inc(kind="test_cases_stream", outcome="ok")
+    LLM_TOKENS.inc(estimate_tokens("".join(received)), direction="completion")
+
+def stream_test_cases(query: str, api_key: str, backend: Optional[LLMBackend] = None,
+                      namespace: Optional[str] = None) -> Iterator[TestCase]:
+    """
+    Streaming variant of generate_test_cases: uses the model's streaming API
+    and yields each test case as soon as its JSON object is complete.
+    Malformed items are skipped; LLM errors are raised to the consumer.
+    """
+    if backend is None:
+        # Created eagerly so configuration errors surface before streaming starts
+        backend = get_backend(api_key)
+    return _iter_test_cases(query, backend, namespace)
+
+def generate_selenium_script(test_case: TestCase, html_content: str, api_key: str,
+                             backend: Optional[LLMBackend] = None, namespace: Optional[str] = None) -> str:
+    """
+    Generates a Selenium script for a test case. The prompt carries a compact
+    selector index of the target page rather than its raw HTML: built from
+    `html_content` when given, otherwise the index persisted when the pages of
+    `namespace` were ingested.
+    `backend` defaults to the configured LLM backend (see app.backend.llm.get_backend).
+    """
+    if backend is None:
+        backend = get_backend(api_key)
     
     # Retrieve context again to ensure we have specific details if needed
-    context = retrieve_context(test_case.scenario)
+    context = retrieve_context(test_case.scenario, namespace=namespace)
+    with timed("page_selectors"):
+        selectors = _page_selectors(html_content, namespace)
     
+    start = time.perf_counter()
     prompt = f"""
     You are an expert Selenium Automation Engineer.
     Generate a robust, executable Python Selenium script for the following test case.
@@ -77,8 +426,8 @@ def generate_selenium_script(test_case: TestCase, html_content: str, api_key: st
     Test Case: {test_case.scenario}
     Expected Result: {test_case.expected_result}
     
-    HTML Structure (Target Page):
-    {html_content}
+    Page Selectors (Target Page, one element per line: tag#id.class followed by its attributes):
+    {selectors}
     
     Additional Context/Rules:
     {context}
@@ -86,7 +435,7 @@ def generate_selenium_script(test_case: TestCase, html_content: str, api_key: st
     Requirements:
     1. Use `selenium` webdriver (assume Chrome).
     2. Use explicit waits (`WebDriverWait`) for stability.
-    3. Use precise selectors based on the provided HTML (IDs, Classes, etc.).
+    3. Use precise selectors based on the provided page selectors (IDs, Names, Classes, etc.).
     4. Include assertions to verify the Expected Result.
     5. Return ONLY the Python code. No markdown formatting, no explanations.
     6. Handle potential errors (try/except).
@@ -98,10 +447,10 @@ def generate_selenium_script(test_case: TestCase, html_content: str, api_key: st
     
     Python Code:
     """
+    observe_stage("build_prompt", start)
     
     try:
-        response = model.generate_content(prompt)
-        text = response.text
+        text = _call_llm(backend, prompt, "script")
         # Clean up code blocks
         if text.startswith("```python"):
             text = text[9:]
@@ -111,4 +460,53 @@ def generate_selenium_script(test_case: TestCase, html_content: str, api_key: st
             text = text[:-3]
         return text.strip()
     except Exception as e:
+        record_error("generate_selenium_script", e)
         return f"# Error generating script: {e}"
+
+def _iter_scripts(test_cases: List[TestCase], html_content: str, api_key: str,
+                  max_concurrency: int, backend: LLMBackend, namespace: Optional[str]) -> Iterator[Tuple[int, str]]:
+    executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="qa-script")
+    try:
+        # Each task runs in a copy of the caller's context so logs keep its request id
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run,
+                generate_selenium_script, test_case, html_content, api_key, backend, namespace,
+            ): i
+            for i, test_case in enumerate(test_cases)
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # Stop scheduling new work if the consumer goes away early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def generate_selenium_scripts(
+    test_cases: List[TestCase],
+    html_content: str,
+    api_key: str,
+    max_concurrency: Optional[int] = None,
+    rate_limit: Optional[float] = None,
+    backend: Optional[LLMBackend] = None,
+    namespace: Optional[str] = None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Generates Selenium scripts for many test cases concurrently.
+    At most `max_concurrency` scripts are generated at once (capped at and
+    defaulting to SCRIPT_BATCH_CONCURRENCY). Upstream LLM calls of all batches
+    share LLM_RATE_LIMIT requests per second (0 = unlimited); `rate_limit` can
+    only lower it for this batch. A given `backend` is throttled the same way.
+    Returns an iterator of (index, script_code) that yields each script as
+    soon as it finishes, in completion order.
+    """
+    max_concurrency = min(max_concurrency or SCRIPT_BATCH_CONCURRENCY, SCRIPT_BATCH_CONCURRENCY)
+    rate_limiter = _batch_rate_limiter
+    if rate_limit is not None and rate_limit > 0 and (LLM_RATE_LIMIT <= 0 or rate_limit < LLM_RATE_LIMIT):
+        batch_limiter = RateLimiter(rate_limit)
+        rate_limiter = batch_limiter if rate_limiter is None else CombinedRateLimiter(rate_limiter, batch_limiter)
+    if backend is None:
+        # Created eagerly so configuration errors surface before streaming starts
+        backend = get_backend(api_key, rate_limiter=rate_limiter)
+    elif rate_limiter is not None:
+        backend = RateLimitedBackend(backend, rate_limiter)
+    return _iter_scripts(test_cases, html_content, api_key, max_concurrency, backend, namespace)
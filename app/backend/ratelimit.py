@@ -0,0 +1,43 @@
+import threading
+import time
+from typing import Optional
+
+class RateLimiter:
+    """
+    Thread-safe token-bucket rate limiter: allows `rate` acquisitions per second
+    on average, with bursts of up to `burst` (defaults to one second's worth).
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(1.0, burst if burst is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class CombinedRateLimiter:
+    """Takes a token from each of several limiters, e.g. a per-batch limit within a shared one."""
+
+    def __init__(self, *limiters: RateLimiter):
+        self.limiters = limiters
+
+    def acquire(self):
+        for limiter in self.limiters:
+            limiter.acquire()
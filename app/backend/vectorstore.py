@@ -0,0 +1,292 @@
+import os
+import json
+import shutil
+import threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+# Vector stores behind the knowledge base. A store exposes the part of the
+# ChromaDB client API the app uses (get_or_create_collection,
+# delete_collection) and its collections the part of the Collection API used
+# by ingestion and retrieval (add, get, update, delete, query, count), so the
+# Chroma client and NumpyVectorStore are interchangeable.
+#
+# NumpyVectorStore keeps each collection in a directory:
+#   vectors-<n>.f32  float32 rows, memory-mapped for search
+#   log.jsonl        header line, then one add/update/delete record per line
+# Opening a collection maps the matrix and replays the log, so nothing is
+# re-embedded. Rows are written before their log record, so a crash can only
+# leave unreferenced rows behind. Deleted rows are compacted away once they
+# outnumber the live ones. A store directory must be used by one process.
+
+# Compaction also waits for at least this many deleted rows
+COMPACT_MIN_DEAD_ROWS = 1024
+
+class NumpyCollection:
+    """A collection held as a memory-mapped float32 matrix with exact (brute-force) search."""
+
+    def __init__(self, path: str, name: str, embedding_function=None):
+        self.path = path
+        self.name = name
+        self.embedding_function = embedding_function
+        self._lock = threading.RLock()
+        self._ids: List[Optional[str]] = []  # per row, None once deleted
+        self._rows: Dict[str, int] = {}
+        self._documents: Dict[str, str] = {}
+        self._metadatas: Dict[str, dict] = {}
+        self._dim: Optional[int] = None
+        self._vectors_file = "vectors-0.f32"
+        self._matrix = None
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        os.makedirs(path, exist_ok=True)
+        self._open()
+
+    # --- Storage -------------------------------------------------------------
+
+    def _log_path(self) -> str:
+        return os.path.join(self.path, "log.jsonl")
+
+    def _open(self):
+        try:
+            with open(self._log_path(), "rb") as f:
+                lines = f.read().splitlines(keepends=True)
+        except FileNotFoundError:
+            self._write_log([])
+            return
+
+        header = json.loads(lines[0])
+        self._dim = header["dim"]
+        self._vectors_file = header["vectors"]
+        records = []
+        offset = len(lines[0])
+        for line in lines[1:]:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("missing newline")
+                records.append(json.loads(line))
+            except ValueError:
+                # Torn write at the end of the log: cut it off so that later
+                # records are not appended to the fragment
+                with open(self._log_path(), "r+b") as f:
+                    f.truncate(offset)
+                break
+            offset += len(line)
+        for record in records:
+            op = record["op"]
+            if op == "add":
+                self._drop(record["id"])
+                row = record["row"]
+                self._ids.extend([None] * (row + 1 - len(self._ids)))
+                self._ids[row] = record["id"]
+                self._rows[record["id"]] = row
+                self._documents[record["id"]] = record["document"]
+                self._metadatas[record["id"]] = record["metadata"]
+            elif op == "update":
+                if record["id"] in self._rows:
+                    self._metadatas[record["id"]] = record["metadata"]
+            elif op == "delete":
+                self._drop(record["id"])
+        self._remap()
+        self._norms = np.einsum("ij,ij->i", self._matrix, self._matrix) if len(self._ids) else self._norms
+        self._alive = np.array([doc_id is not None for doc_id in self._ids], dtype=bool)
+
+    def _drop(self, doc_id: str):
+        row = self._rows.pop(doc_id, None)
+        if row is not None:
+            self._ids[row] = None
+            self._documents.pop(doc_id, None)
+            self._metadatas.pop(doc_id, None)
+
+    def _remap(self):
+        rows = len(self._ids)
+        if rows == 0 or self._dim is None:
+            self._matrix = np.zeros((0, self._dim or 0), dtype=np.float32)
+        else:
+            self._matrix = np.memmap(os.path.join(self.path, self._vectors_file), dtype=np.float32,
+                                     mode="r", shape=(rows, self._dim))
+
+    def _write_log(self, records: List[dict]):
+        tmp_path = self._log_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"dim": self._dim, "vectors": self._vectors_file}) + "\n")
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, self._log_path())
+
+    def _append_log(self, records: List[dict]):
+        with open(self._log_path(), "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+
+    def _compact(self):
+        """Rewrites the matrix and the log with the live rows only."""
+        live = [row for row, doc_id in enumerate(self._ids) if doc_id is not None]
+        vectors = np.asarray(self._matrix[live]) if live else np.zeros((0, self._dim or 0), dtype=np.float32)
+        old_file = self._vectors_file
+        self._vectors_file = f"vectors-{int(old_file[len('vectors-'):-len('.f32')]) + 1}.f32"
+        with open(os.path.join(self.path, self._vectors_file), "wb") as f:
+            f.write(vectors.tobytes())
+
+        ids = [self._ids[row] for row in live]
+        self._ids = ids
+        self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        self._write_log([
+            {"op": "add", "id": doc_id, "row": row, "document": self._documents[doc_id],
+             "metadata": self._metadatas[doc_id]}
+            for row, doc_id in enumerate(ids)
+        ])
+        self._remap()
+        self._norms = self._norms[live]
+        self._alive = np.ones(len(ids), dtype=bool)
+        os.remove(os.path.join(self.path, old_file))
+
+    # --- Collection API ------------------------------------------------------
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def add(self, ids: List[str], documents: List[str], metadatas: Optional[List[dict]] = None,
+            embeddings=None):
+        """Appends chunks; embeddings are computed with the embedding function when not given."""
+        if not ids:
+            return
+        if embeddings is None:
+            embeddings = self.embedding_function(list(documents))
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        metadatas = metadatas or [{} for _ in ids]
+
+        with self._lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                self._write_log([])
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the collection ({self._dim})")
+
+            start = len(self._ids)
+            with open(os.path.join(self.path, self._vectors_file), "ab") as f:
+                # Rows left unreferenced by a crash are overwritten
+                f.truncate(start * self._dim * 4)
+                f.write(vectors.tobytes())
+
+            records = []
+            for offset, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+                self._drop(doc_id)
+                self._ids.append(doc_id)
+                self._rows[doc_id] = start + offset
+                self._documents[doc_id] = document
+                self._metadatas[doc_id] = dict(metadata or {})
+                records.append({"op": "add", "id": doc_id, "row": start + offset, "document": document,
+                                "metadata": self._metadatas[doc_id]})
+            self._append_log(records)
+
+            self._remap()
+            self._norms = np.concatenate([self._norms, np.einsum("ij,ij->i", vectors, vectors)])
+            self._alive = np.array([doc_id is not None for doc_id in self._ids], dtype=bool)
+
+    def update(self, ids: List[str], metadatas: List[dict]):
+        """Replaces the metadata of existing chunks (unknown ids are ignored)."""
+        with self._lock:
+            records = []
+            for doc_id, metadata in zip(ids, metadatas):
+                if doc_id in self._rows:
+                    self._metadatas[doc_id] = dict(metadata or {})
+                    records.append({"op": "update", "id": doc_id, "metadata": self._metadatas[doc_id]})
+            self._append_log(records)
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            records = []
+            for doc_id in ids:
+                row = self._rows.get(doc_id)
+                if row is not None:
+                    self._drop(doc_id)
+                    self._alive[row] = False
+                    records.append({"op": "delete", "id": doc_id})
+            self._append_log(records)
+
+            dead = len(self._ids) - len(self._rows)
+            if dead >= COMPACT_MIN_DEAD_ROWS and dead > len(self._rows):
+                self._compact()
+
+    def _result(self, doc_ids: List[str], rows: List[int], include: List[str]) -> Dict[str, Any]:
+        return {
+            "ids": doc_ids,
+            "documents": [self._documents[i] for i in doc_ids] if "documents" in include else None,
+            "metadatas": [dict(self._metadatas[i]) for i in doc_ids] if "metadatas" in include else None,
+            "embeddings": (np.array(self._matrix[rows]) if rows else np.zeros((0, self._dim or 0), dtype=np.float32))
+            if "embeddings" in include else None,
+        }
+
+    def get(self, ids: Optional[List[str]] = None, limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Returns the requested chunks that exist, or a page of all chunks in insertion order."""
+        include = ["documents", "metadatas"] if include is None else include
+        with self._lock:
+            if ids is None:
+                doc_ids = [doc_id for doc_id in self._ids if doc_id is not None]
+                start = offset or 0
+                doc_ids = doc_ids[start:start + limit if limit is not None else None]
+            else:
+                doc_ids = [doc_id for doc_id in ids if doc_id in self._rows]
+            return self._result(doc_ids, [self._rows[i] for i in doc_ids], include)
+
+    def query(self, query_embeddings=None, query_texts: Optional[List[str]] = None, n_results: int = 10,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Exact nearest neighbours by squared L2 distance (Chroma's default
+        metric) for a batch of queries, scored with one matrix product.
+        """
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(list(query_texts))
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+
+        results = {key: [] for key in ("ids", "documents", "metadatas", "embeddings", "distances")}
+        with self._lock:
+            live = len(self._rows)
+            k = min(n_results, live)
+            if k:
+                # |q - x|^2 = |q|^2 + |x|^2 - 2 q.x, deleted rows pushed past every live one
+                distances = (np.einsum("ij,ij->i", queries, queries)[:, None] + self._norms[None, :]
+                             - 2.0 * (queries @ self._matrix.T))
+                distances[:, ~self._alive] = np.inf
+                top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            for q in range(len(queries)):
+                rows = []
+                if k:
+                    rows = top[q][np.argsort(distances[q, top[q]])].tolist()
+                result = self._result([self._ids[row] for row in rows], rows, include)
+                for key in ("ids", "documents", "metadatas", "embeddings"):
+                    results[key].append(result[key])
+                results["distances"].append([max(0.0, float(distances[q, row])) for row in rows])
+        for key in ("documents", "metadatas", "embeddings", "distances"):
+            if key not in include:
+                results[key] = None
+        return results
+
+class NumpyVectorStore:
+    """Store of NumpyCollections, one directory each under `path`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, name: str, embedding_function=None) -> NumpyCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self._collections[name] = NumpyCollection(
+                    os.path.join(self.path, name), name, embedding_function
+                )
+            elif embedding_function is not None:
+                collection.embedding_function = embedding_function
+            return collection
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+            path = os.path.join(self.path, name)
+            if not os.path.isdir(path):
+                raise ValueError(f"Collection {name} does not exist")
+            shutil.rmtree(path)
@@ -0,0 +1,133 @@
+"""
+Local stand-in for the Gemini REST API, for load tests and offline runs.
+
+Serves generateContent and streamGenerateContent for any model with the
+deterministic responses of the stub LLM backend, and can inject latency and
+transient failures (429 / 503) to exercise rate limiting, retries and
+request coalescing. GET /stats reports the number of requests received.
+
+Usage:
+    python -m benchmarks.fake_gemini [--port 8089] [--latency 0.5] [--error-rate 0.2]
+    GEMINI_API_ENDPOINT=http://localhost:8089 GEMINI_TRANSPORT=rest streamlit run streamlit_app.py
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class FakeGemini:
+    """Request handling state shared by all connections."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        sys.path.insert(0, ROOT)
+        from app.backend.llm import StubBackend
+        self.backend = StubBackend(latency=0)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_status(self) -> int:
+        with self._lock:
+            self.requests += 1
+            if self._random.random() < self.error_rate:
+                self.failures += 1
+                return self._random.choice([429, 503])
+            return 200
+
+    def respond(self, body: dict) -> str:
+        prompt = "".join(part.get("text", "") for content in body.get("contents", [])
+                         for part in content.get("parts", []))
+        return self.backend.generate(prompt)
+
+def _response(text: str) -> dict:
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                            "finishReason": "STOP", "index": 0}]}
+
+def make_handler(fake: FakeGemini):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.startswith("/stats"):
+                self._send_json(200, {"requests": fake.requests, "failures": fake.failures})
+            else:
+                self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            path = self.path.split("?")[0]
+            if not path.endswith((":generateContent", ":streamGenerateContent")):
+                self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+                return
+
+            status = fake.next_status()
+            if status != 200:
+                message = "Resource has been exhausted" if status == 429 else "The service is unavailable"
+                self._send_json(status, {"error": {"code": status, "message": message,
+                                                   "status": "RESOURCE_EXHAUSTED" if status == 429 else "UNAVAILABLE"}})
+                return
+
+            text = fake.respond(body)
+            if path.endswith(":generateContent"):
+                time.sleep(fake.latency)
+                self._send_json(200, _response(text))
+                return
+
+            # Streamed as a chunked JSON array, one response per piece
+            pieces = [text[i:i + 64] for i in range(0, len(text), 64)] or [""]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, piece in enumerate(pieces):
+                time.sleep(fake.latency / len(pieces))
+                chunk = ("[" if i == 0 else ",") + json.dumps(_response(piece)) + ("]" if i == len(pieces) - 1 else "")
+                data = chunk.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+def serve(port: int = 8089, latency: float = 0.0, error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Starts the fake server on a background thread and returns it (port 0 picks a free port)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(FakeGemini(latency, error_rate)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Gemini REST API")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 429/503")
+    args = parser.parse_args(argv)
+    server = serve(args.port, args.latency, args.error_rate)
+    print(f"Fake Gemini API on http://127.0.0.1:{server.server_address[1]}", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Benchmark harness for the QA agent pipeline.
+
+Stages:
+- parse + chunk throughput per file type (synthetic corpora scaled from data/)
+- embedding throughput (encoder only, cache disabled)
+- collection.add and retrieve_context latency as the corpus grows
+- end-to-end generate_test_cases / generate_selenium_script latency against the stub LLM
+
+Usage:
+    python -m benchmarks.run [--scale N] [--output results.json]
+    python -m benchmarks.run --update-baseline      # store results as the baseline
+    python -m benchmarks.run --check                # exit 1 on regressions vs the baseline
+
+Results are machine-readable JSON: {"meta": {...}, "metrics": {name: {"value", "unit", "better"}}}.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES_DIR = os.path.join(ROOT, "data")
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+class Results:
+    def __init__(self):
+        self.metrics: Dict[str, dict] = {}
+
+    def record(self, name: str, value: float, unit: str, better: str):
+        """better is "higher" or "lower"."""
+        self.metrics[name] = {"value": round(value, 6), "unit": unit, "better": better}
+        print(f"  {name:<48} {value:>12.4f} {unit}", file=sys.stderr)
+
+def _percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def _time(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+# --- Synthetic corpora -------------------------------------------------------
+
+def _sample(name: str) -> bytes:
+    with open(os.path.join(SAMPLES_DIR, name), "rb") as f:
+        return f.read()
+
+def build_corpus(scale: int) -> Dict[str, bytes]:
+    """One synthetic document per file type, made of `50 * scale` varied copies of the samples."""
+    copies = 50 * scale
+    md = _sample("product_specs.md").decode("utf-8")
+    txt = _sample("ui_ux_guide.txt").decode("utf-8")
+    data = json.loads(_sample("api_endpoints.json"))
+    html = _sample("checkout.html").decode("utf-8")
+    body = html[html.find("<body>") + len("<body>"):html.find("</body>")] if "<body>" in html else html
+
+    corpus = {
+        "corpus.md": "\n\n".join(f"# Copy {i}\n{md}" for i in range(copies)).encode("utf-8"),
+        "corpus.txt": "\n\n".join(f"Copy {i}\n{txt}" for i in range(copies)).encode("utf-8"),
+        "corpus.json": json.dumps({f"copy_{i}": data for i in range(copies)}, indent=2).encode("utf-8"),
+        "corpus.html": (
+            "<html><body>"
+            + "".join(f"<section id='copy{i}'><h1>Copy {i}</h1>{body}</section>" for i in range(copies))
+            + "</body></html>"
+        ).encode("utf-8"),
+    }
+    try:
+        import fitz  # PyMuPDF
+        doc = fitz.open()
+        for i in range(copies):
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(36, 36, 576, 806), f"Copy {i}\n{txt}", fontsize=9)
+        corpus["corpus.pdf"] = doc.tobytes()
+        doc.close()
+    except Exception as e:
+        print(f"Skipping PDF corpus: {e}", file=sys.stderr)
+    return corpus
+
+def synthetic_chunks(count: int, seed: int = 0) -> List[str]:
+    """Distinct chunk-sized texts built from the sample vocabulary."""
+    words = " ".join(_sample(n).decode("utf-8", errors="ignore") for n in
+                     ("product_specs.md", "ui_ux_guide.txt", "api_endpoints.json")).split()
+    rng = random.Random(seed)
+    return [f"chunk {i}: " + " ".join(rng.choice(words) for _ in range(150)) for i in range(count)]
+
+def hashing_embedding_function(dim: int = 384):
+    """
+    Deterministic bag-of-words hashing encoder, for machines without the
+    sentence-transformers model. Only stages other than `embed` stay comparable.
+    """
+    import hashlib
+    import numpy as np
+    from chromadb.api.types import EmbeddingFunction, Documents
+
+    class HashingEmbeddingFunction(EmbeddingFunction[Documents]):
+        def __init__(self):
+            pass
+
+        def __call__(self, input: Documents):
+            vectors = []
+            for text in input:
+                vector = np.zeros(dim, dtype=np.float32)
+                for word in text.lower().split():
+                    vector[int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16) % dim] += 1.0
+                norm = np.linalg.norm(vector)
+                vectors.append(vector / norm if norm else vector)
+            return vectors
+
+        @staticmethod
+        def name() -> str:
+            return "benchmark_hashing"
+
+        def get_config(self) -> dict:
+            return {"dim": dim}
+
+        @staticmethod
+        def build_from_config(config):
+            return hashing_embedding_function(config.get("dim", 384))
+
+        def is_legacy(self) -> bool:
+            return True
+
+    return HashingEmbeddingFunction()
+
+# --- Stages ------------------------------------------------------------------
+
+def bench_parse(results: Results, corpus: Dict[str, bytes], repeats: int):
+    from app.backend.ingestion import iter_document_chunks
+    print("parse + chunk", file=sys.stderr)
+    for name, content in corpus.items():
+        ext = name.rsplit(".", 1)[1]
+        chunks = []
+        seconds = min(_time(lambda: chunks.append(list(iter_document_chunks(content, name)))) for _ in range(repeats))
+        megabytes = len(content) / 1e6
+        results.record(f"parse.{ext}.mb_per_s", megabytes / seconds, "MB/s", "higher")
+        results.record(f"parse.{ext}.chunks_per_s", len(chunks[-1]) / seconds, "chunks/s", "higher")
+
+def bench_embedding(results: Results, count: int):
+    from app.backend.ingestion import get_embedding_function
+    print("embedding", file=sys.stderr)
+    embedding_function = get_embedding_function()
+    texts = synthetic_chunks(count, seed=1)
+    embedding_function(texts[:8])  # warm-up
+    seconds = _time(lambda: embedding_function(texts))
+    results.record("embed.chunks_per_s", count / seconds, "chunks/s", "higher")
+
+def bench_retrieval(results: Results, sizes: List[int], queries: int):
+    from app.backend import ingestion, rag
+    print("collection.add / retrieve_context", file=sys.stderr)
+    collection = ingestion.get_knowledge_base()
+    texts = synthetic_chunks(max(sizes), seed=2)
+    query_texts = [f"{word} validation" for word in synthetic_chunks(queries, seed=3)[0].split()[2:2 + queries]]
+    added = 0
+    for size in sizes:
+        batch = texts[added:size]
+        ids = [f"bench_{added + i}" for i in range(len(batch))]
+        metadatas = [{"source": "bench.txt", "chunk_index": added + i} for i in range(len(batch))]
+        seconds = _time(lambda: collection.add(ids=ids, documents=batch, metadatas=metadatas))
+        ingestion._on_change(ingestion._get_kb(), added=(ids, batch, metadatas))
+        added = size
+        results.record(f"add.{size}.ms_per_chunk", 1000 * seconds / max(1, len(batch)), "ms", "lower")
+
+        for mode in ("vector", "hybrid", "lexical", "multi"):
+            latencies = []
+            for query in query_texts:
+                rag._retrieval_cache.clear()
+                latencies.append(1000 * _time(lambda: rag.retrieve_context(query, mode=mode)))
+            results.record(f"retrieve.{mode}.{size}.p50_ms", statistics.median(latencies), "ms", "lower")
+            results.record(f"retrieve.{mode}.{size}.p95_ms", _percentile(latencies, 0.95), "ms", "lower")
+
+def bench_end_to_end(results: Results, runs: int):
+    from app.backend import rag
+    from app.backend.llm import StubBackend
+    print("end-to-end (stub LLM)", file=sys.stderr)
+    backend = StubBackend(latency=0)
+    test_cases_ms, script_ms = [], []
+    for i in range(runs):
+        rag._retrieval_cache.clear()
+        test_cases = []
+        test_cases_ms.append(1000 * _time(lambda: test_cases.extend(
+            rag.generate_test_cases(f"Discount Code {i}", "", backend=backend))))
+        script_ms.append(1000 * _time(lambda: rag.generate_selenium_script(
+            test_cases[0], _sample("checkout.html").decode("utf-8"), "", backend=backend)))
+    results.record("e2e.test_cases.p50_ms", statistics.median(test_cases_ms), "ms", "lower")
+    results.record("e2e.script.p50_ms", statistics.median(script_ms), "ms", "lower")
+
+# --- Baseline comparison ----------------------------------------------------
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Returns a message per metric that regressed by more than `tolerance` (a fraction)."""
+    regressions = []
+    for name, base in baseline.get("metrics", {}).items():
+        metric = current["metrics"].get(name)
+        if metric is None or not base["value"]:
+            continue
+        change = (metric["value"] - base["value"]) / base["value"]
+        if (base["better"] == "higher" and change < -tolerance) or (base["better"] == "lower" and change > tolerance):
+            regressions.append(f"{name}: {base['value']} -> {metric['value']} {metric['unit']} ({change:+.0%})")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="QA agent benchmark suite")
+    parser.add_argument("--scale", type=int, default=1, help="corpus scale factor")
+    parser.add_argument("--repeats", type=int, default=3, help="repeats per parse measurement (best is kept)")
+    parser.add_argument("--sizes", default="200,1000,3000", help="corpus sizes (chunks) for retrieval latency")
+    parser.add_argument("--queries", type=int, default=20, help="queries per retrieval measurement")
+    parser.add_argument("--e2e-runs", type=int, default=10)
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 if any metric regressed vs the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (fraction)")
+    parser.add_argument("--embedding", choices=["model", "hash"], default="model",
+                        help="hash: deterministic hashing encoder instead of the sentence-transformers model")
+    parser.add_argument("--skip", default="", help="comma-separated stages to skip: parse,embed,retrieval,e2e")
+    args = parser.parse_args(argv)
+    skip = set(filter(None, args.skip.split(",")))
+
+    # Isolated, cache-free environment; must be set before the backend is imported
+    workdir = tempfile.mkdtemp(prefix="qa-bench-")
+    os.environ["CHROMA_DATA_PATH"] = os.path.join(workdir, "chroma_db")
+    os.environ["EMBEDDING_CACHE_MAX_ENTRIES"] = "0"
+    os.environ["LLM_CACHE_MAX_ENTRIES"] = "0"
+    os.environ["LLM_BACKEND"] = "stub"
+    sys.path.insert(0, ROOT)
+    if args.embedding == "hash":
+        from app.backend import ingestion
+        ingestion._embedding_function = hashing_embedding_function()
+
+    results = Results()
+    if "parse" not in skip:
+        bench_parse(results, build_corpus(args.scale), args.repeats)
+    if "embed" not in skip:
+        bench_embedding(results, 256 * args.scale)
+    if "retrieval" not in skip:
+        bench_retrieval(results, [int(s) for s in args.sizes.split(",")], args.queries)
+    if "e2e" not in skip:
+        bench_end_to_end(results, args.e2e_runs)
+
+    from app.backend import ingestion
+    current = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "scale": args.scale,
+            "chunker": ingestion.CHUNKER,
+            "embedding_model": ingestion.EMBEDDING_MODEL if args.embedding == "model" else "hash",
+            "embedding_backend": os.environ.get("EMBEDDING_BACKEND", "sentence-transformers"),
+            "vector_store": ingestion.VECTOR_STORE,
+        },
+        "metrics": results.metrics,
+    }
+    output = json.dumps(current, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(current, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions and args.check:
+            return 1
+    elif args.check:
+        print(f"No baseline at {args.baseline}; run with --update-baseline first", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
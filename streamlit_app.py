@@ -1,6 +1,93 @@
+import os
+from typing import Optional
 import streamlit as st
-from app.backend.ingestion import ingest_uploaded_files, clear_knowledge_base
-from app.backend.rag import generate_test_cases, generate_selenium_script
+from app.backend.cache import LRUCache
+from app.backend.ingestion import (
+    ingest_uploaded_files, normalize_namespace, get_kb_generation, warm_up, DEFAULT_NAMESPACE,
+)
+from app.backend.jobs import Job, JobManager
+from app.backend.models import TestCase
+from app.backend.rag import stream_test_cases, generate_selenium_script, generate_selenium_scripts
+
+# Background jobs (knowledge base builds, generation) shared by all sessions;
+# the page polls them every JOB_POLL_SECONDS instead of blocking on them
+UI_JOB_WORKERS = int(os.environ.get("UI_JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "1"))
+# Generated test plans kept per (project, knowledge base version, feature)
+TEST_CASE_MEMO_SIZE = int(os.environ.get("TEST_CASE_MEMO_SIZE", "128"))
+
+# Streamlit reruns this script on every interaction; resources are created
+# once per server process and survive reruns
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    return JobManager(max_workers=UI_JOB_WORKERS)
+
+@st.cache_resource
+def get_test_case_memo() -> LRUCache:
+    return LRUCache(max_size=TEST_CASE_MEMO_SIZE)
+
+@st.cache_resource(show_spinner="Loading knowledge base...")
+def load_knowledge_base(namespace: str):
+    # Loads the embedding model and opens the collection before the first query
+    warm_up(namespace)
+
+def start_job(key: str, kind: str, fn, *args):
+    """Submits a background job and remembers it in the session under `key`."""
+    st.session_state[key] = get_job_manager().submit(kind, fn, *args).id
+
+def session_job(key: str) -> Optional[Job]:
+    job_id = st.session_state.get(key)
+    job = get_job_manager().get(job_id) if job_id else None
+    if job_id and job is None:
+        # Finished jobs are trimmed eventually
+        del st.session_state[key]
+    return job
+
+def _ingest_job(job: Job, file_data: list, namespace: str) -> dict:
+    job.update_progress(files=len(file_data), batches=0, chunks_added=0)
+    # Incremental: unchanged chunks are not re-embedded, files that are no
+    # longer uploaded are removed
+    stats = {}
+    ingest_uploaded_files(
+        file_data,
+        prune=True,
+        progress=lambda batches, added: job.update_progress(batches=batches, chunks_added=added),
+        namespace=namespace,
+        stats=stats,
+    )
+    return stats
+
+def _test_case_job(job: Job, query: str, api_key: str, namespace: str, memo: LRUCache, memo_key: tuple) -> list:
+    test_cases = []
+    # Test cases are published as soon as each one has been generated
+    for tc in stream_test_cases(query, api_key, namespace=namespace):
+        test_cases.append(tc.model_dump())
+        job.update_progress(test_cases=list(test_cases))
+    if test_cases:
+        memo.set(memo_key, test_cases)
+    return test_cases
+
+def _script_job(job: Job, test_case: dict, html_content: str, api_key: str, namespace: str) -> str:
+    return generate_selenium_script(TestCase(**test_case), html_content, api_key, namespace=namespace)
+
+def _batch_script_job(job: Job, test_cases: list, html_content: str, api_key: str, namespace: str) -> dict:
+    all_cases = [TestCase(**tc) for tc in test_cases]
+    scripts = {}
+    # Scripts are generated concurrently and published as each one finishes
+    for index, script_code in generate_selenium_scripts(all_cases, html_content, api_key, namespace=namespace):
+        scripts[index] = script_code
+        job.update_progress(scripts=dict(scripts))
+    return scripts
+
+def finish_job(key: str, job: Job, on_success):
+    """Moves a finished job's outcome into the session and reruns the whole page."""
+    del st.session_state[key]
+    if job.status == "completed":
+        on_success(job.result)
+    else:
+        st.session_state[f"{key}_error"] = job.error
+    st.rerun()
 
 # Page Config
 st.set_page_config(page_title="Autonomous QA Agent", layout="wide")
@@ -151,6 +238,15 @@ api_key = st.text_input("Google Gemini API Key", type="password")
 if not api_key:
     st.warning("Please enter your Google Gemini API Key to proceed.")
 
+# Every project gets its own knowledge base
+namespace = st.text_input("Project", DEFAULT_NAMESPACE, help="Knowledge bases are kept separately per project")
+try:
+    namespace = normalize_namespace(namespace)
+except ValueError as e:
+    st.error(str(e))
+    st.stop()
+load_knowledge_base(namespace)
+
 # 1. Knowledge Base
 st.header("1. Knowledge Base")
 uploaded_files = st.file_uploader(
@@ -159,58 +255,108 @@ uploaded_files = st.file_uploader(
     type=['md', 'txt', 'json', 'html', 'pdf']
 )
 
-if st.button("Build Knowledge Base"):
+building = session_job("kb_job") is not None
+if st.button("Build Knowledge Base", disabled=building):
     if uploaded_files:
-        with st.spinner("Building Knowledge Base..."):
-            try:
-                # Clear existing knowledge base
-                clear_knowledge_base()
-                
-                # Prepare files for ingestion
-                file_data = [(file.name, file.getvalue()) for file in uploaded_files]
-                
-                # Store HTML content in session state for script generation
-                html_content = None
-                for file in uploaded_files:
-                    if file.name.endswith('.html'):
-                        html_content = file.getvalue().decode('utf-8')
-                        st.session_state['html_content'] = html_content
-                        break
-                
-                # Ingest documents
-                num_chunks = ingest_uploaded_files(file_data)
-                st.success(f"Success! Knowledge Base Built Successfully ({num_chunks} chunks)")
-            except Exception as e:
-                st.error(f"Error: {e}")
+        # Prepare files for ingestion
+        file_data = [(file.name, file.getvalue()) for file in uploaded_files]
+
+        # Store HTML content in session state for script generation
+        for file in uploaded_files:
+            if file.name.endswith('.html'):
+                st.session_state['html_content'] = file.getvalue().decode('utf-8')
+                break
+
+        # The build runs in the background; the rest of the page stays usable
+        st.session_state.pop('kb_job_error', None)
+        st.session_state.pop('kb_stats', None)
+        start_job("kb_job", "ingestion", _ingest_job, file_data, namespace)
+        st.rerun()
     else:
         st.warning("Please upload files first.")
 
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def kb_job_status():
+    job = session_job("kb_job")
+    if job is None:
+        return
+    if job.done:
+        finish_job("kb_job", job, lambda stats: st.session_state.update(kb_stats=stats))
+    progress = job.progress
+    st.info(
+        f"Building Knowledge Base... {progress.get('chunks_added', 0)} chunks embedded "
+        f"({progress.get('batches', 0)} batches)"
+    )
+
+if building:
+    kb_job_status()
+elif 'kb_job_error' in st.session_state:
+    st.error(f"Error: {st.session_state['kb_job_error']}")
+elif 'kb_stats' in st.session_state:
+    kb_stats = st.session_state['kb_stats']
+    st.success(
+        f"Success! Knowledge Base Built Successfully ({kb_stats['chunks']} chunks, "
+        f"{kb_stats['duplicates']} near-duplicates skipped)"
+    )
+
 # Main Area
 st.header("2. Test Case Generation")
 
 query = st.text_input("Enter a feature to test (e.g., 'Discount Code', 'Shipping')", "Discount Code")
 
-if st.button("Generate Test Cases"):
+generating = session_job("test_case_job") is not None
+# Script jobs index into the current test plan, so it cannot change under them
+scripting = session_job("script_job") is not None or session_job("batch_script_job") is not None
+if st.button("Generate Test Cases", disabled=generating or scripting):
     if not api_key:
         st.error("API Key is required!")
     else:
-        with st.spinner("Analyzing documents..."):
-            try:
-                test_cases = generate_test_cases(query, api_key)
-                st.session_state['test_cases'] = [tc.dict() for tc in test_cases]
-                st.success(f"Generated {len(test_cases)} test cases.")
-            except Exception as e:
-                st.error(f"Error: {e}")
+        st.session_state.pop('test_case_job_error', None)
+        # Test plans are memoised per knowledge base version, so regenerating
+        # the same feature against an unchanged knowledge base is free
+        memo = get_test_case_memo()
+        memo_key = (namespace, get_kb_generation(namespace), query)
+        # Scripts belong to the previous test plan
+        st.session_state.pop('script', None)
+        st.session_state.pop('scripts', None)
+        cached = memo.get(memo_key)
+        if cached is not None:
+            st.session_state['test_cases'] = cached
+        else:
+            st.session_state['test_cases'] = []
+            start_job("test_case_job", "test_cases", _test_case_job, query, api_key, namespace, memo, memo_key)
+            st.rerun()
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def test_case_job_status():
+    job = session_job("test_case_job")
+    if job is None:
+        return
+    if job.done:
+        finish_job("test_case_job", job, lambda test_cases: st.session_state.update(test_cases=test_cases))
+    test_cases = job.progress.get('test_cases', [])
+    if test_cases:
+        st.info(f"Generating test cases... ({len(test_cases)} so far)")
+    else:
+        st.info("Analyzing documents...")
+    for tc in test_cases:
+        st.markdown(f"- **{tc['test_id']}**: {tc['scenario']}")
+
+if generating:
+    test_case_job_status()
+elif 'test_case_job_error' in st.session_state:
+    st.error(f"Error: {st.session_state['test_case_job_error']}")
 
 # Display Test Cases
-if 'test_cases' in st.session_state and st.session_state['test_cases']:
+if not generating and st.session_state.get('test_cases'):
     st.subheader("Generated Test Cases")
     
     # Create a list of labels for the radio button
-    options = range(len(st.session_state['test_cases']))
+    test_cases = st.session_state['test_cases']
+    options = range(len(test_cases))
     
     def format_option(i):
-        tc = st.session_state['test_cases'][i]
+        tc = test_cases[i]
         return f"{tc['test_id']}: {tc['scenario']}"
     
     selected_test_case_index = st.radio(
@@ -225,23 +371,60 @@ if 'test_cases' in st.session_state and st.session_state['test_cases']:
     st.json(selected_case)
     
     st.header("3. Selenium Script Generation")
-    if st.button("Generate Selenium Script"):
+    html_content = st.session_state.get('html_content', '')
+
+    if st.button("Generate Selenium Script", disabled=scripting):
         if not api_key:
             st.error("API Key is required!")
         else:
-            with st.spinner("Generating script..."):
-                try:
-                    #Get HTML content from session state
-                    html_content = st.session_state.get('html_content', '')
-                    
-                    if not html_content:
-                        st.warning("No HTML file found. Please upload checkout.html when building the knowledge base.")
-                    
-                    # Convert selected_case dict back to TestCase object
-                    from app.backend.models import TestCase
-                    test_case_obj = TestCase(**selected_case)
-                    
-                    script_code = generate_selenium_script(test_case_obj, html_content, api_key)
-                    st.code(script_code, language='python')
-                except Exception as e:
-                    st.error(f"Error: {e}")
+            if not html_content:
+                st.warning("No HTML file found. Please upload checkout.html when building the knowledge base.")
+            st.session_state.pop('script_job_error', None)
+            st.session_state.pop('script', None)
+            start_job("script_job", "script", _script_job, selected_case, html_content, api_key, namespace)
+            st.rerun()
+
+    if st.button("Generate Scripts for All Test Cases", disabled=scripting):
+        if not api_key:
+            st.error("API Key is required!")
+        else:
+            st.session_state.pop('batch_script_job_error', None)
+            st.session_state.pop('scripts', None)
+            start_job(
+                "batch_script_job", "scripts", _batch_script_job,
+                st.session_state['test_cases'], html_content, api_key, namespace,
+            )
+            st.rerun()
+
+    def show_scripts(scripts: dict):
+        for index, script_code in sorted(scripts.items()):
+            tc = st.session_state['test_cases'][index]
+            with st.expander(f"{tc['test_id']}: {tc['scenario']}"):
+                st.code(script_code, language='python')
+
+    @st.fragment(run_every=JOB_POLL_SECONDS)
+    def script_job_status():
+        job = session_job("script_job")
+        if job is not None:
+            if job.done:
+                finish_job("script_job", job, lambda script: st.session_state.update(script=script))
+            st.info("Generating script...")
+
+        job = session_job("batch_script_job")
+        if job is not None:
+            if job.done:
+                finish_job("batch_script_job", job, lambda scripts: st.session_state.update(scripts=scripts))
+            scripts = job.progress.get('scripts', {})
+            total = len(st.session_state['test_cases'])
+            st.progress(len(scripts) / total, text=f"Generated {len(scripts)}/{total} scripts")
+            show_scripts(scripts)
+
+    if scripting:
+        script_job_status()
+    for key in ('script_job_error', 'batch_script_job_error'):
+        if key in st.session_state:
+            st.error(f"Error: {st.session_state[key]}")
+    if 'script' in st.session_state:
+        st.code(st.session_state['script'], language='python')
+    if 'scripts' in st.session_state:
+        show_scripts(st.session_state['scripts'])
@@ -0,0 +1,27 @@
+import os
+import numpy as np
+from app.backend.vectorstore import NumpyCollection
+
+def _add(collection, ids):
+    collection.add(ids=ids, documents=[f"doc {i}" for i in ids], metadatas=[{"source": i} for i in ids],
+                   embeddings=[np.random.default_rng(ord(i)).random(4, dtype=np.float32) for i in ids])
+
+def test_torn_log_record_is_truncated_on_open(tmp_path):
+    path = str(tmp_path / "collection")
+    _add(NumpyCollection(path, "test"), ["a", "b"])
+
+    # Crash in the middle of appending a record
+    with open(os.path.join(path, "log.jsonl"), "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "id": "c", "ro')
+
+    collection = NumpyCollection(path, "test")
+    assert collection.count() == 2
+    _add(collection, ["x", "y"])
+    assert collection.count() == 4
+
+    reopened = NumpyCollection(path, "test")
+    assert reopened.count() == 4
+    assert reopened.get(ids=["a", "b", "x", "y"])["ids"] == ["a", "b", "x", "y"]
+    result = reopened.query(query_embeddings=reopened.get(ids=["y"], include=["embeddings"])["embeddings"],
+                            n_results=1)
+    assert result["ids"] == [["y"]]